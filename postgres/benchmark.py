@@ -0,0 +1,185 @@
+# benchmarks for the preprocessing transforms, run on synthetic openFDA-shaped records
+import argparse
+import random
+import time
+import tracemalloc
+
+import pandas as pd
+
+from config import REPORT_COLS, PATIENT_COLS, REACTION_COLS, DRUGREPORT_COLS, REPORT_BOOL_COLS
+from helpers import convert_boolean, drop_invalid_dict_rows, convert_age, list_min
+from preprocess import process_event_json
+
+def make_event_records(n, seed=0):
+    """Generates `n` synthetic event records shaped like an openFDA drug/event partition."""
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        record = {
+            'safetyreportid': str(10000000 + i),
+            'safetyreportversion': str(rng.randint(1, 3)),
+            'primarysourcecountry': rng.choice(['US', 'GB', 'FR']),
+            'occurcountry': rng.choice(['US', 'GB', 'FR', None]),
+            'transmissiondateformat': '102',
+            'transmissiondate': '20040701',
+            'reporttype': str(rng.randint(1, 4)),
+            'patient': {
+                'patientonsetage': str(rng.randint(1, 90)),
+                'patientonsetageunit': rng.choice(['801', '802', '803', '804', '805', '806', '999']),
+                'patientsex': rng.choice(['0', '1', '2']),
+                'patientweight': str(round(rng.uniform(3, 120), 1)),
+                'reaction': [
+                    {
+                        'reactionmeddraversionpt': '16.1',
+                        'reactionmeddrapt': rng.choice(['Nausea', 'Headache', 'Rash', 'Dizziness']),
+                        'reactionoutcome': str(rng.randint(1, 6)),
+                    }
+                    for _ in range(rng.randint(1, 4))
+                ],
+                'drug': [
+                    {
+                        'drugcharacterization': str(rng.randint(1, 3)),
+                        'medicinalproduct': f'DRUG{rng.randint(0, 500)}',
+                        'openfda': {'spl_id': [f'spl-{rng.randint(0, 2000)}' for _ in range(rng.randint(0, 3))]},
+                    }
+                    for _ in range(rng.randint(1, 4))
+                ],
+            },
+        }
+        for col in REPORT_BOOL_COLS:
+            record[col] = rng.choice(['1', '2', None])
+        records.append(record)
+    return records
+
+# Reference row-wise implementations, as they were before vectorization
+
+def legacy_convert_boolean(df, colnames, true_val=1, false_val=2):
+    df = df.copy()
+    for col in colnames:
+        df[col] = df[col].apply(lambda x: True if x == true_val else False)
+    return df
+
+def legacy_drop_invalid_dict_rows(df, column_name, required_key):
+    def is_valid(d):
+        if not isinstance(d, dict) or not d:
+            return False
+        if required_key not in d:
+            return False
+        val = d[required_key]
+        if val is None or (isinstance(val, float)):
+            return False
+        if isinstance(val, list) and len(val) == 0:
+            return False
+        return True
+    return df[df[column_name].apply(is_valid)]
+
+def legacy_convert_age(df, age="patientonsetage", ageformat="patientonsetageunit"):
+    interval_units = {801: "decade", 802: "year", 803: "month", 804: "week", 805: "day", 806: "hour"}
+
+    def to_interval_string(row):
+        fmt = pd.to_numeric(row[ageformat], errors='coerce')
+        value = pd.to_numeric(row[age], errors='coerce')
+        unit = interval_units.get(fmt)
+        if unit is None or pd.isnull(value):
+            return None
+        return f"{float(value)} {unit}"
+
+    df["age"] = df.apply(to_interval_string, axis=1)
+    return df
+
+def legacy_list_min(series):
+    return series.apply(lambda x: min(x) if isinstance(x, list) and x else None)
+
+def legacy_process_event_json(data):
+    raw_df = pd.DataFrame(data)
+
+    reports = raw_df[list(set(REPORT_COLS) & set(raw_df.columns))]
+
+    patient_df = pd.json_normalize(raw_df['patient'])
+    patient_df = legacy_convert_age(patient_df)
+    patient_df = patient_df[list(set(PATIENT_COLS) & set(patient_df.columns))]
+    reports = pd.concat([reports, patient_df], axis=1)
+
+    patient_df = pd.json_normalize(raw_df['patient'])
+    patient_df['safetyreportid'] = raw_df['safetyreportid']
+
+    reactions_exploded = patient_df.copy()
+    reactions_exploded = reactions_exploded.explode('reaction').reset_index(drop=True)
+    reactions_normalized = pd.json_normalize(reactions_exploded['reaction'])
+    reactions = pd.concat([reactions_exploded.drop(columns=['reaction']), reactions_normalized], axis=1)
+    reactions = reactions[list(set(REACTION_COLS) & set(reactions.columns))]
+
+    drugreports = patient_df.explode('drug').reset_index(drop=True)
+    dr_normalized = pd.json_normalize(drugreports['drug'])
+    drugreports = pd.concat([dr_normalized, drugreports.drop(columns=['drug'])], axis=1)
+    drugreports['spl_id_primary'] = legacy_list_min(drugreports['openfda.spl_id'])
+    drugreports = drugreports[DRUGREPORT_COLS]
+
+    reports = reports.where(pd.notnull(reports), None)
+    reactions = reactions.where(pd.notnull(reactions), None)
+    drugreports = drugreports.where(pd.notnull(drugreports), None).drop_duplicates()
+
+    reports = legacy_convert_boolean(reports, REPORT_BOOL_COLS)
+
+    return {'reports': reports, 'reactions': reactions, 'drugreports': drugreports}
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def compare(name, legacy, current, *args):
+    """Times both implementations on the same input and checks their outputs are identical."""
+    expected, t_legacy = timed(legacy, *args)
+    actual, t_current = timed(current, *args)
+    if isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(expected, actual)
+    else:
+        pd.testing.assert_series_equal(expected, actual, check_names=False)
+    print(f'{name:<24} before {t_legacy:8.3f}s   after {t_current:8.3f}s   speedup {t_legacy / t_current:6.1f}x')
+
+def peak_memory(fn, *args):
+    """Peak Python heap allocated while running `fn`, in MB."""
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2**20
+
+def bench_event_transform(records):
+    expected, t_legacy = timed(legacy_process_event_json, records)
+    actual, t_current = timed(process_event_json, records)
+    for name in expected:
+        # the old column order came from a set, so compare columns by name
+        pd.testing.assert_frame_equal(expected[name].sort_index(axis=1), actual[name].sort_index(axis=1))
+    print(f'{"process_event_json":<24} before {t_legacy:8.3f}s   after {t_current:8.3f}s   speedup {t_legacy / t_current:6.1f}x')
+
+    m_legacy = peak_memory(legacy_process_event_json, records)
+    m_current = peak_memory(process_event_json, records)
+    print(f'{"  peak memory":<24} before {m_legacy:7.1f}MB   after {m_current:7.1f}MB')
+
+def bench_helpers(records):
+    raw_df = pd.DataFrame(records)
+    patient_df = pd.json_normalize(raw_df['patient'])
+    drugs = pd.json_normalize(patient_df['drug'].explode().tolist())
+
+    compare('convert_boolean', legacy_convert_boolean, convert_boolean, raw_df, REPORT_BOOL_COLS)
+    compare('drop_invalid_dict_rows', legacy_drop_invalid_dict_rows, drop_invalid_dict_rows, raw_df, 'patient', 'drug')
+    compare('convert_age', lambda df: legacy_convert_age(df.copy()), lambda df: convert_age(df.copy()), patient_df)
+    compare('list_min', legacy_list_min, list_min, drugs['openfda.spl_id'])
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--records', type=int, default=100000, help="number of synthetic event records")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for the synthetic records")
+
+    args = parser.parse_args()
+
+    records = make_event_records(args.records, args.seed)
+    print(f'{args.records} synthetic event records')
+    bench_helpers(records)
+    bench_event_transform(records)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,16 @@
 # DATA PATHS
 EVENT_LINK_FILE = 'event_links.txt'
 LABEL_LINK_FILE = 'label_links.txt'
+EVENT_MANIFEST_FILE = 'event_manifest.json'
+LABEL_MANIFEST_FILE = 'label_manifest.json'
+CACHE_DIR = 'postgres/cache'
+STAGING_DIR = 'postgres/staging'
+
+# DOWNLOAD SETTINGS
+DOWNLOAD_WORKERS = 4            # concurrent fetches
+DOWNLOAD_PREFETCH = 4           # partitions fetched ahead of the one being processed
+DOWNLOAD_CHUNK_SIZE = 1 << 20   # bytes per streamed read
+STREAM_CHUNK_SIZE = 10000       # records per chunk in --stream mode
 
 # COLNAMES FOR PROCESSING
 LABEL_COLS =        ['drugid', 'spl_product_data_elements', 'indications_and_usage', 'dosage_and_administration', 'dosage_forms_and_strengths', 'contraindications', 'warnings_and_cautions', 'adverse_reactions', 'drug_interactions', 'use_in_specific_populations', 'pregnancy', 'pediatric_use', 'geriatric_use', 'overdosage', 'description', 'nonclinical_toxicology', 'carcinogenesis_and_mutagenesis_and_impairment_of_fertility', 'animal_pharmacology_and_or_toxicology', 'information_for_patients', 'package_label_principal_display_panel', 'set_id', 'effective_time', 'openfda', 'warnings', 'precautions', 'general_precautions', 'storage_and_handling', 'active_ingredient', 'purpose', 'pregnancy_or_breast_feeding', 'keep_out_of_reach_of_children', 'ask_doctor', 'inactive_ingredient', 'other_safety_information', 'boxed_warning', 'nursing_mothers', 'drug_abuse_and_dependence', 'controlled_substance', 'abuse', 'dependence', 'risks', 'labor_and_delivery', 'laboratory_tests', 'teratogenic_effects', 'drug_and_or_laboratory_test_interactions', 'nonteratogenic_effects', 'when_using', 'stop_use', 'do_not_use', 'instructions_for_use', 'ask_doctor_or_pharmacist', 'health_care_provider_letter', 'safe_handling_warning', 'patient_medication_information', 'components', 'intended_use_of_the_device', 'user_safety_warnings', 'cleaning', 'summary_of_safety_and_effectiveness', 'statement_of_identity', 'information_for_owners_or_caregivers', 'veterinary_indications', 'health_claim', 'alarms']
@@ -15,4 +25,14 @@ REPORT_BOOL_COLS =  ['serious', 'seriousnessdeath', 'seriousnesslifethreatening'
 # POSTGRES DETAILS
 POSTGRES_SCHEMA = "openfda"
 SCHEMA_FILEPATH = 'postgres/schema.sql'
-DROP_FILEPATH = 'postgres/drop.sql'
\ No newline at end of file
+INDEX_FILEPATH = 'postgres/indexes.sql'
+VIEWS_FILEPATH = 'postgres/views.sql'
+MIGRATION_FILEPATH = 'postgres/migrate.sql'
+DROP_FILEPATH = 'postgres/drop.sql'
+BULK_TABLES = ['reports', 'reactions', 'drugs', 'drugreports']   # created UNLOGGED by --unlogged
+MATERIALIZED_VIEWS = ['medications', 'med_counts']               # refreshed at the end of every ingest
+
+# CONNECTION POOL (postgres/pool.py), one per process
+POOL_MAX_SIZE = 10              # open connections at most; further checkouts wait
+POOL_TIMEOUT = 30               # seconds a checkout waits for a free connection
+POOL_HEALTH_CHECK_AFTER = 30    # seconds idle after which a connection is pinged before reuse
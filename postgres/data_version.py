@@ -0,0 +1,56 @@
+# stamp of the loaded data, bumped by every ingest so downstream caches know when to drop results
+from postgres.pool import get_db_conn
+
+def get_data_version(conn=None):
+    """
+    Returns the current data version stamp, e.g. '12@2025-06-01T12:00:00.123456'.
+
+    The stamp includes the time of the last bump, so a rebuilt schema (whose counter starts
+    over at 1) never repeats an earlier stamp. None if the schema has no version table.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_conn()
+    cur = conn.cursor()
+
+    cur.execute("SELECT to_regclass('openfda.data_version') IS NOT NULL")
+    version = None
+    if cur.fetchone()[0]:
+        cur.execute("SELECT version, updated_at FROM openfda.data_version")
+        row = cur.fetchone()
+        if row is not None:
+            version = f'{row[0]}@{row[1].isoformat()}'
+
+    conn.commit()
+    cur.close()
+    if own_conn:
+        conn.close()
+    return version
+
+def bump_data_version(conn=None):
+    """
+    Marks the data as changed (call after a load). Returns the new stamp, or None if the
+    schema has no version table (postgres/migrate.sql creates it).
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_conn()
+    cur = conn.cursor()
+
+    cur.execute("SELECT to_regclass('openfda.data_version') IS NOT NULL")
+    version = None
+    if cur.fetchone()[0]:
+        # an upsert, in case the row is missing
+        cur.execute("""
+            INSERT INTO openfda.data_version (version) VALUES (1)
+            ON CONFLICT (id) DO UPDATE SET version = data_version.version + 1, updated_at = clock_timestamp()
+            RETURNING version, updated_at
+        """)
+        row = cur.fetchone()
+        version = f'{row[0]}@{row[1].isoformat()}'
+
+    conn.commit()
+    cur.close()
+    if own_conn:
+        conn.close()
+    return version
@@ -1,42 +1,170 @@
 import requests
-import io
 import zipfile
 import json
+import ijson
 import os
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import CACHE_DIR, DOWNLOAD_WORKERS, DOWNLOAD_PREFETCH, DOWNLOAD_CHUNK_SIZE
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)'
+                  'AppleWebKit/537.36 (KHTML, like Gecko)'
+                  'Chrome/135.0.0.0 Safari/537.36'
+}
+
+def read_links(file, skip, limit):
+    """Reads up to `limit` links from a link file, after skipping the first `skip`."""
+    links = []
+    with open(file, 'r', encoding='utf-8') as file:
+        s = 0
+        while (s < skip):
+            junk = file.readline()
+            s += 1
+        l = 0
+        while (l < limit):
+            link = file.readline()
+            if not link:
+                break
+            if link.strip():
+                links.append(link.strip())
+            l += 1
+    return links
+
+def make_session(pool_size):
+    """Creates a pooled HTTP session shared by all download threads."""
+    session = requests.Session()
+    retry = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(HEADERS)
+    return session
 
 class Downloader:
-    def __init__(self, file, skip, limit):
-        self.links = []
-        with open(file, 'r', encoding='utf-8') as file:
-            s = 0
-            while (s < skip):
-                junk = file.readline()
-                s += 1
-            l = 0
-            while (l < limit):
-                self.links.append(file.readline())
-                l += 1
-    
-    def get(self):
-        url = self.links.pop(0).strip()
-        print(url)
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)' 
-                          'AppleWebKit/537.36 (KHTML, like Gecko)' 
-                          'Chrome/135.0.0.0 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers)
-        
-        # Unzip the file in memory
-        with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-            json_filename = z.namelist()[0]  # Assuming 1 file inside
-            with z.open(json_filename) as f:
-                data = json.load(f)['results']  # Convert JSON into Python dict
+    """
+    Downloads openFDA partitions listed in a link file.
+
+    Up to `prefetch` partitions are fetched ahead of the one being processed,
+    using a bounded pool of `workers` threads. Completed zips are written to a
+    content-addressed cache (`<cache_dir>/objects/<sha256>.zip`), with a pointer
+    per URL (`<cache_dir>/urls/<sha256(url)>`), so a crashed run can resume
+    without re-downloading the partitions it already fetched.
+    """
+    def __init__(self, file, skip, limit, workers=DOWNLOAD_WORKERS, prefetch=DOWNLOAD_PREFETCH, cache_dir=CACHE_DIR, links=None):
+        # an explicit list of `links` (e.g. only the changed partitions) replaces the link file
+        self.links = list(links) if links is not None else read_links(file, skip, limit)
+
+        self.prefetch = max(prefetch, 0)
+        self.cache_dir = cache_dir
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, 'urls'), exist_ok=True)
+
+        self.session = make_session(workers)
+        self.executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='downloader')
+        self.pending = []  # (url, future) pairs, in link order
+
+    def _pointer_path(self, url):
+        return os.path.join(self.cache_dir, 'urls', hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def cached_path(self, url):
+        """Returns the cached zip for `url`, or None if it has not been downloaded yet."""
+        pointer = self._pointer_path(url)
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer, 'r', encoding='utf-8') as f:
+            digest = f.read().strip()
+        path = os.path.join(self.cache_dir, 'objects', f'{digest}.zip')
+        return path if os.path.exists(path) else None
 
+    def fetch(self, url):
+        """Streams `url` into the cache (if not already there) and returns the local zip path."""
+        path = self.cached_path(url)
+        if path is not None:
+            return path
+
+        sha = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.cache_dir, 'objects'), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                with self.session.get(url, stream=True, timeout=60) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        sha.update(chunk)
+                        out.write(chunk)
+            digest = sha.hexdigest()
+            path = os.path.join(self.cache_dir, 'objects', f'{digest}.zip')
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        # Write the pointer last, so an interrupted download is never treated as complete
+        pointer = self._pointer_path(url)
+        with open(f'{pointer}.part', 'w', encoding='utf-8') as f:
+            f.write(digest)
+        os.replace(f'{pointer}.part', pointer)
+
+        return path
+
+    def _fill(self):
+        """Keeps the current partition plus `prefetch` upcoming partitions in flight."""
+        while self.links and len(self.pending) < self.prefetch + 1:
+            url = self.links.pop(0)
+            self.pending.append((url, self.executor.submit(self.fetch, url)))
+
+    def next_path(self):
+        """Returns (url, local zip path) for the next partition, prefetching the ones after it."""
+        self._fill()
+        url, future = self.pending.pop(0)
+        self._fill()
+        print(url)
+        path = future.result()
         print('file downloaded')
+        return url, path
 
-        return data
+    def get(self):
+        url, path = self.next_path()
+        return load_zip(path)
 
+    def stream(self, chunk_size):
+        """Yields the next partition's `results` in lists of at most `chunk_size` records."""
+        url, path = self.next_path()
+        yield from iter_zip(path, chunk_size)
 
     def size(self):
-        return len(self.links)
\ No newline at end of file
+        return len(self.links) + len(self.pending)
+
+    def close(self):
+        for _, future in self.pending:
+            future.cancel()
+        self.pending = []
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+def load_zip(path):
+    """Reads the `results` list out of a downloaded openFDA zip."""
+    with zipfile.ZipFile(path) as z:
+        json_filename = z.namelist()[0]  # Assuming 1 file inside
+        with z.open(json_filename) as f:
+            data = json.load(f)['results']  # Convert JSON into Python dict
+    return data
+
+def iter_zip(path, chunk_size):
+    """Incrementally parses the `results` list out of a downloaded openFDA zip, `chunk_size` records at a time."""
+    with zipfile.ZipFile(path) as z:
+        json_filename = z.namelist()[0]  # Assuming 1 file inside
+        with z.open(json_filename) as f:
+            chunk = []
+            for record in ijson.items(f, 'results.item', use_float=True):
+                chunk.append(record)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
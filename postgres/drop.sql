@@ -1,8 +1,9 @@
-DROP VIEW openFDA.medications;
-
-DROP TABLE openFDA.drugreports;
+-- CASCADE also drops the medications and med_counts views, materialized or not (older schemas)
+DROP TABLE openFDA.drugreports CASCADE;
 DROP TABLE openFDA.reactions;
-DROP TABLE openFDA.drugs;
+DROP TABLE openFDA.drugs CASCADE;
 DROP TABLE openFDA.reports;
+DROP TABLE IF EXISTS openFDA.loaded_partitions;
+DROP TABLE IF EXISTS openFDA.data_version;
 
 DROP SCHEMA openFDA CASCADE;
\ No newline at end of file
@@ -1,9 +1,12 @@
 # helper functions for preprocessing
+import io
+import numpy as np
 import pandas as pd
-from postgres.auth import Auth
+from postgres.pool import get_pool
 
 def get_db_conn():
-    return Auth.get_db_conn()
+    """Checks out a connection from the process-wide pool. `conn.close()` returns it."""
+    return get_pool().getconn()
 
 def rename_columns(df, prefix):
     """Renames columns starting with 'openfda.' by removing the 'openfda.' prefix."""
@@ -16,9 +19,7 @@ def rename_columns(df, prefix):
 def convert_boolean (df, colnames, true_val = 1, false_val = 2):
     df = df.copy()
     for col in colnames:
-        df[col] = df[col].apply(
-            lambda x: True if x == true_val else False
-        )
+        df[col] = df[col].isin([true_val])
     
     return df
 
@@ -37,19 +38,14 @@ def drop_invalid_dict_rows(df, column_name, required_key):
     Returns:
     - A new filtered DataFrame
     """
-    def is_valid(d):
-        if not isinstance(d, dict) or not d:
-            return False
-        if required_key not in d:
-            return False
-        val = d[required_key]
-        if val is None or (isinstance(val, float)):
-            return False
-        if isinstance(val, list) and len(val) == 0:
-            return False
-        return True
-
-    new_df = df[df[column_name].apply(is_valid)]
+    # dicts can't be vectorized, so pull the required value out in one pass and test it column-wise
+    values = [d.get(required_key) if isinstance(d, dict) else None for d in df[column_name].to_numpy()]
+    valid = np.fromiter(
+        (v is not None and not isinstance(v, float) and not (isinstance(v, list) and len(v) == 0) for v in values),
+        dtype=bool, count=len(values)
+    )
+
+    new_df = df[valid]
 
     print(f'dropped {len(df) - len(new_df)} out of {len(df)} rows')
 
@@ -81,14 +77,69 @@ def convert_age(df, age="patientonsetage", ageformat="patientonsetageunit"):
         806: "hour"
     }
 
-    def to_interval_string(row):
-        fmt = row[ageformat]
-        age = row[age]
-        unit = interval_units.get(fmt)
-        if unit is None or pd.isnull(age):
-            return None
-        return f"{float(age)} {unit}"
+    # openFDA encodes both fields as strings, so coerce before mapping
+    units = pd.to_numeric(df[ageformat], errors='coerce').map(interval_units)
+    ages = pd.to_numeric(df[age], errors='coerce').astype(float)
+    valid = units.notna() & ages.notna()
 
-    df["age"] = df.apply(to_interval_string, axis=1)
+    intervals = pd.Series(np.full(len(df), None, dtype=object), index=df.index)
+    intervals[valid] = ages[valid].astype(str) + ' ' + units[valid]
+    df["age"] = intervals
 
     return df
+
+def list_min(series):
+    """Returns the smallest element of each list in `series` (None for empty lists and non-lists)."""
+    # explode/groupby is slower than a plain pass here, since the lists hold only a few strings
+    mins = [min(x) if type(x) is list and x else None for x in series.to_numpy()]
+    return pd.Series(mins, index=series.index, dtype=object, name=series.name)
+
+def _copy_escape(text):
+    """Escapes a value for PostgreSQL's COPY text format."""
+    return (text.replace('\\', '\\\\')
+                .replace('\t', '\\t')
+                .replace('\n', '\\n')
+                .replace('\r', '\\r'))
+
+def _array_literal(values):
+    """Formats a list as a PostgreSQL array literal, e.g. {"a","b"}."""
+    elements = []
+    for v in values:
+        if v is None or (isinstance(v, float) and v != v):
+            elements.append('NULL')
+        else:
+            v = str(v).replace('\\', '\\\\').replace('"', '\\"')
+            elements.append(f'"{v}"')
+    return '{' + ','.join(elements) + '}'
+
+def _copy_value(v):
+    """Formats a single cell for COPY. None/NaN map to the NULL marker \\N."""
+    if v is None:
+        return '\\N'
+    if isinstance(v, bool):
+        return 't' if v else 'f'
+    if isinstance(v, float):
+        if v != v:
+            return '\\N'
+        # integral floats come from NaN-padded int columns and must load into INT columns
+        return str(int(v)) if v.is_integer() else repr(v)
+    if isinstance(v, (list, tuple)):
+        return _copy_escape(_array_literal(v))
+    return _copy_escape(str(v))
+
+def to_copy_buffer(df):
+    """
+    Serializes a DataFrame into an in-memory buffer in PostgreSQL's COPY text format.
+
+    Lists are written as array literals (for the TEXT[] columns of openfda.drugs),
+    booleans as t/f, and None/NaN as NULL.
+
+    Returns:
+        A StringIO positioned at the start, ready for `cursor.copy_expert`.
+    """
+    buf = io.StringIO()
+    for row in df.itertuples(index=False, name=None):
+        buf.write('\t'.join(_copy_value(v) for v in row))
+        buf.write('\n')
+    buf.seek(0)
+    return buf
@@ -0,0 +1,30 @@
+-- Keys, foreign keys and secondary indexes, built once the tables are loaded.
+-- schema.sql creates the tables bare, and init_schema runs this file straight away
+-- unless the load is deferred, in which case finalize_schema runs it afterwards.
+
+DELETE FROM openfda.drugs a
+USING openfda.drugs b
+WHERE a.drugid = b.drugid AND a.ctid < b.ctid;
+
+DELETE FROM openfda.drugreports a
+USING openfda.drugreports b
+WHERE a.drugid = b.drugid AND a.reportid = b.reportid AND a.ctid < b.ctid;
+
+ALTER TABLE openfda.reactions ADD CONSTRAINT reactions_pkey PRIMARY KEY (reactionid);
+ALTER TABLE openfda.drugs ADD CONSTRAINT drugs_pkey PRIMARY KEY (drugid);
+ALTER TABLE openfda.drugreports ADD CONSTRAINT drugreports_pkey PRIMARY KEY (drugid, reportid);
+
+ALTER TABLE openfda.reactions ADD CONSTRAINT reactions_reportid_fkey FOREIGN KEY (reportid) REFERENCES openfda.reports(reportid);
+ALTER TABLE openfda.drugreports ADD CONSTRAINT drugreports_drugid_fkey FOREIGN KEY (drugid) REFERENCES openfda.drugs(drugid);
+ALTER TABLE openfda.drugreports ADD CONSTRAINT drugreports_reportid_fkey FOREIGN KEY (reportid) REFERENCES openfda.reports(reportid);
+
+CREATE INDEX IF NOT EXISTS reports_safetyreportid_idx ON openfda.reports (safetyreportid);
+CREATE INDEX IF NOT EXISTS reactions_reportid_idx ON openfda.reactions (reportid);
+CREATE INDEX IF NOT EXISTS drugreports_reportid_idx ON openfda.drugreports (reportid);
+CREATE INDEX IF NOT EXISTS drugs_spl_id_primary_idx ON openfda.drugs (spl_id_primary);
+CREATE INDEX IF NOT EXISTS drugs_ingested_at_idx ON openfda.drugs (ingested_at);
+
+ANALYZE openfda.reports;
+ANALYZE openfda.reactions;
+ANALYZE openfda.drugs;
+ANALYZE openfda.drugreports;
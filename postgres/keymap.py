@@ -0,0 +1,79 @@
+# in-memory key resolution for linking event rows to reports and drugs
+import pandas as pd
+
+from helpers import get_db_conn
+
+class KeyMap:
+    """
+    Run-wide cache of the keys needed to link event rows.
+
+    - `reports`: safetyreportid -> latest (MAX) reportid, as in `construct_linked_df`
+    - `drugs`: spl_id_primary -> list of drugids, as in `insert_dr`
+
+    The cache is loaded from the database once, then kept current by learning
+    from each partition as it is inserted, so linking costs time proportional
+    to the partition rather than to the size of the database.
+    """
+    def __init__(self):
+        self.reports = {}
+        self.drugs = {}
+        self.max_reportid = 0
+
+    @classmethod
+    def load(cls):
+        """Builds a KeyMap from the current contents of openfda.reports and openfda.drugs."""
+        keymap = cls()
+        keymap.refresh_reports()
+
+        conn = get_db_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT drugid, spl_id_primary FROM openfda.drugs;")
+        for drugid, spl_id_primary in cur.fetchall():
+            keymap._add_drug(spl_id_primary, drugid)
+        cur.close()
+        conn.close()
+
+        return keymap
+
+    def refresh_reports(self, conn=None):
+        """Learns reports inserted since the last refresh. reportid is SERIAL, so new rows sort after `max_reportid`."""
+        own_conn = conn is None
+        if own_conn:
+            conn = get_db_conn()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT safetyreportid, reportid
+            FROM openfda.reports
+            WHERE reportid > %s
+            ORDER BY reportid;
+        """, (self.max_reportid,))
+        for safetyreportid, reportid in cur.fetchall():
+            self.reports[safetyreportid] = reportid
+            self.max_reportid = reportid
+        cur.close()
+        if own_conn:
+            conn.close()
+
+    def learn_drugs(self, drugs):
+        """Learns the spl_id_primary -> drugid pairs of an inserted openfda.drugs DataFrame."""
+        for spl_id_primary, drugid in zip(drugs['spl_id_primary'], drugs['drugid']):
+            self._add_drug(spl_id_primary, drugid)
+
+    def _add_drug(self, spl_id_primary, drugid):
+        if spl_id_primary is None or pd.isnull(spl_id_primary):
+            return
+        drugids = self.drugs.setdefault(spl_id_primary, [])
+        if drugid not in drugids:
+            drugids.append(drugid)
+
+    def link_reports(self, df):
+        """Replaces `safetyreportid` with the matching `reportid`."""
+        linked = df.copy()
+        linked['reportid'] = linked['safetyreportid'].map(self.reports)
+        return linked.drop(['safetyreportid'], axis=1)
+
+    def link_drugs(self, df):
+        """Adds the `drugid`(s) matching each row's `spl_id_primary`, one row per drugid."""
+        linked = df.copy()
+        linked['drugid'] = linked['spl_id_primary'].map(self.drugs)
+        return linked.explode('drugid', ignore_index=True)
@@ -1,7 +1,9 @@
+import json
+
 import pandas as pd
 import requests
 
-from config import LABEL_LINK_FILE, EVENT_LINK_FILE
+from config import LABEL_LINK_FILE, EVENT_LINK_FILE, LABEL_MANIFEST_FILE, EVENT_MANIFEST_FILE
 
 link_json = requests.get('https://api.fda.gov/download.json').json()
 raw = link_json['results']['drug']
@@ -16,6 +18,10 @@ with open(label_link, 'w', encoding='utf-8') as label_file:
     for link in label_df['file']:
         label_file.write(f'{link}\n')
 
+# keep the partition metadata for incremental refreshes
+with open(LABEL_MANIFEST_FILE, 'w', encoding='utf-8') as label_manifest:
+    json.dump({'export_date': label_full.get('export_date'), 'partitions': label_full['partitions']}, label_manifest, indent=1)
+
 
 event_full = raw['event']
 
@@ -25,4 +31,7 @@ event_link = EVENT_LINK_FILE
 
 with open(event_link, 'w', encoding='utf-8') as event_file:
     for link in event_df['file']:
-        event_file.write(f'{link}\n')
\ No newline at end of file
+        event_file.write(f'{link}\n')
+
+with open(EVENT_MANIFEST_FILE, 'w', encoding='utf-8') as event_manifest:
+    json.dump({'export_date': event_full.get('export_date'), 'partitions': event_full['partitions']}, event_manifest, indent=1)
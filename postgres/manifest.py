@@ -0,0 +1,83 @@
+# partition manifests and load tracking for incremental refreshes
+import json
+import os
+
+from helpers import get_db_conn
+
+def load_manifest(path):
+    """
+    Reads a manifest written by `linkgen.py`.
+
+    Returns:
+        An ordered dict of partition URL -> metadata (`export_date`, `size_mb`, `records`,
+        `display_name`), or an empty dict if the manifest has not been generated.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    partitions = {}
+    for partition in manifest['partitions']:
+        meta = dict(partition)
+        meta['export_date'] = manifest.get('export_date')
+        partitions[meta.pop('file')] = meta
+    return partitions
+
+def loaded_partitions(dataset, conn=None):
+    """Returns URL -> (size_mb, records) for every partition of `dataset` already loaded."""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT url, size_mb, records
+        FROM openfda.loaded_partitions
+        WHERE dataset = %s;
+    """, (dataset,))
+    loaded = {url: (size_mb, records) for url, size_mb, records in cur.fetchall()}
+    cur.close()
+    if own_conn:
+        conn.close()
+    return loaded
+
+def changed_partitions(manifest, loaded):
+    """
+    Lists the manifest URLs that are new or whose partition metadata changed, in manifest order.
+
+    `export_date` is dataset-wide and moves on every openFDA export, so partitions are compared
+    on their own size and record count instead.
+    """
+    changed = []
+    for url, meta in manifest.items():
+        previous = loaded.get(url)
+        current = (_to_float(meta.get('size_mb')), _to_int(meta.get('records')))
+        if previous is None or (_to_float(previous[0]), _to_int(previous[1])) != current:
+            changed.append(url)
+    return changed
+
+def mark_loaded(url, dataset, meta=None, conn=None):
+    """Records (or refreshes) a loaded partition in openfda.loaded_partitions."""
+    meta = meta or {}
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO openfda.loaded_partitions (url, dataset, export_date, size_mb, records, loaded_at)
+        VALUES (%s, %s, %s, %s, %s, now())
+        ON CONFLICT (url) DO UPDATE
+        SET export_date = EXCLUDED.export_date,
+            size_mb = EXCLUDED.size_mb,
+            records = EXCLUDED.records,
+            loaded_at = EXCLUDED.loaded_at;
+    """, (url, dataset, meta.get('export_date'), _to_float(meta.get('size_mb')), _to_int(meta.get('records'))))
+    conn.commit()
+    cur.close()
+    if own_conn:
+        conn.close()
+
+def _to_float(value):
+    return None if value is None else float(value)
+
+def _to_int(value):
+    return None if value is None else int(value)
@@ -0,0 +1,24 @@
+-- Brings a schema created by an earlier version up to date, so an existing database can be
+-- loaded into without --init. postgres.py runs this before every load that doesn't rebuild
+-- the schema, so every statement must be safe to run again.
+
+CREATE TABLE IF NOT EXISTS openfda.loaded_partitions (
+    url TEXT PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    export_date DATE,
+    size_mb REAL,
+    records INT,
+    loaded_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+-- existing labels get the time of the migration, so the search name resolver reloads them once
+ALTER TABLE openfda.drugs ADD COLUMN IF NOT EXISTS ingested_at TIMESTAMP DEFAULT now();
+CREATE INDEX IF NOT EXISTS drugs_ingested_at_idx ON openfda.drugs (ingested_at);
+
+CREATE TABLE IF NOT EXISTS openfda.data_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT clock_timestamp()
+);
+
+INSERT INTO openfda.data_version (version) VALUES (1) ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,80 @@
+# staged download / transform / load pipeline
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from downloader import load_zip, iter_zip
+from preprocess import process_event_json, process_label_json
+from staging import Staging
+
+_DONE = object()
+
+def process_partition(process, url, path, chunk_size=None, staging_dir=None):
+    """
+    Yields `process(chunk)` for each chunk of one cached zip (the whole file if `chunk_size` is None).
+
+    If `staging_dir` is set, every processed chunk is also written to the Parquet staging area.
+    """
+    chunks = iter_zip(path, chunk_size) if chunk_size else [load_zip(path)]
+    writer = Staging(staging_dir).writer(url) if staging_dir else None
+    for chunk in chunks:
+        processed = process(chunk)
+        if writer is not None:
+            writer.write(processed)
+        yield processed
+    if writer is not None:
+        writer.commit()
+
+def transform_labels(url, path, chunk_size=None, staging_dir=None):
+    """Worker-side transform of one cached label zip. Returns a list of processed chunks."""
+    return list(process_partition(process_label_json, url, path, chunk_size, staging_dir))
+
+def transform_events(url, path, chunk_size=None, staging_dir=None):
+    """Worker-side transform of one cached event zip. Returns a list of processed chunks."""
+    return list(process_partition(process_event_json, url, path, chunk_size, staging_dir))
+
+def run_pipeline(dl, transform, load, workers, max_inflight=None, chunk_size=None, staging_dir=None, done=None, verbose=False):
+    """
+    Runs a partition list through three stages:
+
+    1. download: `dl` fetches partitions on its own thread pool (bounded by its prefetch)
+    2. transform: a pool of `workers` processes runs `transform(url, path, chunk_size, staging_dir)`
+    3. load: `load(chunk)` is called on this thread, one chunk at a time, in link order,
+       followed by `done(url)` once all of a partition's chunks are loaded
+
+    A feeder thread submits downloaded partitions to the process pool through a
+    queue of at most `max_inflight` partitions, which blocks downloads when the
+    loader falls behind. Loading happens on a single thread and in order, so each
+    partition's `reports` are committed before the rows that link to them.
+    """
+    max_inflight = max_inflight or 2 * workers
+    inflight = queue.Queue(maxsize=max_inflight)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def feed():
+            try:
+                while dl.size():
+                    url, path = dl.next_path()
+                    inflight.put((url, pool.submit(transform, url, path, chunk_size, staging_dir)))
+            except BaseException as e:
+                inflight.put((None, e))
+            finally:
+                inflight.put((None, _DONE))
+
+        feeder = threading.Thread(target=feed, name='pipeline-feeder', daemon=True)
+        feeder.start()
+
+        while True:
+            url, item = inflight.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            for chunk in item.result():
+                load(chunk)
+            if done is not None:
+                done(url)
+            if verbose:
+                print(f'loaded {url}')
+
+        feeder.join()
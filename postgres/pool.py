@@ -0,0 +1,223 @@
+# process-wide PostgreSQL connection pool, shared by ingest, search and the webapp
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+from postgres.auth import Auth
+from postgres.config import POOL_MAX_SIZE, POOL_TIMEOUT, POOL_HEALTH_CHECK_AFTER
+
+class PoolTimeout(RuntimeError):
+    """No connection became available within the pool timeout."""
+
+class PooledConnection:
+    """
+    A connection checked out of a ConnectionPool.
+
+    Behaves like the underlying psycopg2 connection (including `with conn:` as a transaction
+    block), except that `close()` returns it to the pool instead of closing it, so code
+    written against `get_db_conn()` / `conn.close()` is pooled without changes.
+    """
+    def __init__(self, pool, conn):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_conn', conn)
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    @property
+    def closed(self):
+        return self._conn is None or self._conn.closed
+
+    def close(self):
+        conn = self._conn
+        if conn is not None:
+            object.__setattr__(self, '_conn', None)
+            self._pool.putconn(conn)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+class ConnectionPool:
+    """
+    Thread-safe pool of at most `max_size` connections, opened on demand with `connect`.
+
+    - `getconn()` hands out an idle connection, opens a new one if below `max_size`, or
+      waits up to `timeout` seconds for one to be returned (raising PoolTimeout).
+    - Connections idle for more than `health_check_after` seconds are checked with
+      `SELECT 1` before being handed out, and replaced if they are broken.
+    - Returned connections are rolled back if left mid-transaction, and discarded if closed.
+    - `stats()` reports checkouts, waits and wait times, and open/active/idle connections.
+    """
+    def __init__(self, connect=Auth.get_db_conn, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT, health_check_after=POOL_HEALTH_CHECK_AFTER):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self.pid = os.getpid()
+        self.cond = threading.Condition()
+        self.idle = []       # (connection, returned at)
+        self.size = 0        # open connections, idle or checked out
+        self.counters = {'checkouts': 0, 'waits': 0, 'wait_time': 0.0, 'max_wait_time': 0.0,
+                         'timeouts': 0, 'created': 0, 'discarded': 0, 'failed_health_checks': 0}
+
+    def getconn(self, timeout=None):
+        """Checks out a connection (a PooledConnection)."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        waited = False
+        with self.cond:
+            while True:
+                if self.idle:
+                    conn, returned_at = self.idle.pop()
+                    break
+                if self.size < self.max_size:
+                    self.size += 1
+                    conn, returned_at = None, None
+                    break
+                remaining = timeout - (time.perf_counter() - start)
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise PoolTimeout(f"no connection available after {timeout}s ({self.max_size} in use)")
+                waited = True
+                self.cond.wait(remaining)
+
+        # connecting and health checks happen outside the lock
+        try:
+            if conn is not None and not self._healthy(conn, returned_at):
+                self._discard(conn, count_size=False)
+                conn = None
+            if conn is None:
+                conn = self.connect()
+                with self.cond:
+                    self.counters['created'] += 1
+        except BaseException:
+            with self.cond:
+                self.size -= 1
+                self.cond.notify()
+            raise
+
+        wait = time.perf_counter() - start
+        with self.cond:
+            self.counters['checkouts'] += 1
+            if waited:
+                self.counters['waits'] += 1
+                self.counters['wait_time'] += wait
+                self.counters['max_wait_time'] = max(self.counters['max_wait_time'], wait)
+        return PooledConnection(self, conn)
+
+    def _healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.health_check_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            with self.cond:
+                self.counters['failed_health_checks'] += 1
+            return False
+
+    def _discard(self, conn, count_size=True):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self.cond:
+            self.counters['discarded'] += 1
+            if count_size:
+                self.size -= 1
+                self.cond.notify()
+
+    def putconn(self, conn):
+        """Returns a raw connection to the pool (use `PooledConnection.close()` instead)."""
+        if conn.closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+        with self.cond:
+            self.idle.append((conn, time.monotonic()))
+            self.cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Checks out a connection for the `with` block, rolling back uncommitted work on exit."""
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self.cond:
+            checkouts = self.counters['checkouts']
+            return {
+                **self.counters,
+                'avg_wait_time': self.counters['wait_time'] / checkouts if checkouts else 0.0,
+                'size': self.size,
+                'idle': len(self.idle),
+                'active': self.size - len(self.idle),
+                'max_size': self.max_size,
+            }
+
+    def closeall(self):
+        with self.cond:
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+        for conn, _ in idle:
+            conn.close()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """The process-wide pool. A forked child (e.g. a pipeline worker) gets its own."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool()
+        return _pool
+
+def get_db_conn():
+    """Checks out a pooled connection. `conn.close()` returns it to the pool."""
+    return get_pool().getconn()
+
+def connect_params():
+    """
+    Connection parameters (host, port, database, user, password) of the configured database,
+    read off a pooled connection, so other drivers (e.g. asyncpg) connect wherever `Auth` does.
+    """
+    with connection() as conn:
+        info = conn.info
+        return {'host': info.host, 'port': info.port, 'database': info.dbname, 'user': info.user, 'password': info.password or None}
+
+def connection(timeout=None):
+    """Context manager checking out a pooled connection: `with connection() as conn: ...`"""
+    return get_pool().connection(timeout)
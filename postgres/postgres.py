@@ -1,10 +1,110 @@
 import argparse
+from functools import partial
 import pandas as pd
 import os
 
-from config import EVENT_LINK_FILE, LABEL_LINK_FILE
-from downloader import Downloader
-from preprocess import process_event_json, process_label_json, insert_data, insert_dr, construct_linked_df, init_schema
+from config import EVENT_LINK_FILE, LABEL_LINK_FILE, EVENT_MANIFEST_FILE, LABEL_MANIFEST_FILE, CACHE_DIR, STAGING_DIR, DOWNLOAD_WORKERS, DOWNLOAD_PREFETCH, STREAM_CHUNK_SIZE
+from downloader import Downloader, read_links
+from keymap import KeyMap
+from manifest import load_manifest, loaded_partitions, changed_partitions, mark_loaded
+from helpers import get_db_conn
+from data_version import bump_data_version
+from pipeline import run_pipeline, process_partition, transform_labels, transform_events
+from preprocess import process_event_json, process_label_json, insert_data, insert_dr, construct_linked_df, supersede_reports, init_schema, finalize_schema, migrate_schema, refresh_views
+from staging import Staging
+
+def load_labels(data, args, keymap=None, conn=None):
+    """Uploads one processed batch of label records."""
+    if isinstance(data, pd.DataFrame):
+        # labels are keyed by version-specific ids, so a reloaded partition only adds new ones
+        on_conflict = 'drugid' if args.incremental else None
+        insert_data('drugs', data, use_copy=args.copy, conn=conn, on_conflict=on_conflict)
+        if keymap is not None:
+            keymap.learn_drugs(data)
+        if args.verbose:
+            print('data uploaded')
+    elif args.verbose:
+        print('No valid data found')
+
+def load_events(data, args, keymap, conn=None):
+    """Uploads one processed batch of event records. Reports are committed before the rows linking to them."""
+    if args.incremental:
+        data = upsert_events(data, conn)
+    insert_data('reports', data['reports'], use_copy=args.copy, conn=conn)
+    keymap.refresh_reports(conn)
+    if args.verbose:
+        print('inserted into reports')
+    reactions = construct_linked_df(data['reactions'].drop(columns='record', errors='ignore'), keymap)
+    insert_data('reactions', reactions, use_copy=args.copy, conn=conn)
+    if args.verbose:
+        print('inserted into reactions')
+    insert_dr(data['drugreports'], use_copy=args.copy, keymap=keymap, conn=conn)
+    if args.verbose:
+        print('inserted into drugreports')
+        print('data uploaded')
+
+def upsert_events(data, conn=None):
+    """Replaces superseded report versions and drops incoming reports older than the stored ones."""
+    reports = data['reports']
+    versions = pd.to_numeric(reports['safetyreportversion'], errors='coerce')
+    reports = reports.loc[versions.sort_values(kind='stable', na_position='first').index].drop_duplicates('safetyreportid', keep='last')
+
+    # rows of the versions dropped above would otherwise be linked to the kept one
+    data = {
+        name: table[table['record'].isin(reports.index)] if name != 'reports' else reports
+        for name, table in data.items()
+    }
+
+    stale = supersede_reports(reports, conn)
+    if not stale:
+        return data
+    return {
+        name: table[~table['safetyreportid'].isin(stale)]
+        for name, table in data.items()
+    }
+
+def ingest(link_file, manifest_file, dataset, skip, limit, process, transform, load, args, conn=None):
+    """Downloads, processes and loads one link file, sequentially or through the staged pipeline."""
+    manifest = load_manifest(manifest_file)
+    links = None
+    if args.incremental:
+        if not manifest:
+            raise RuntimeError(f"--incremental needs {manifest_file}; run linkgen.py first")
+        links = changed_partitions(manifest, loaded_partitions(dataset, conn))[skip:skip + limit]
+        print(f'{len(links)} new or changed {dataset} partitions')
+
+    dl = Downloader(link_file, skip, limit, workers=args.download_workers, prefetch=args.prefetch, cache_dir=args.cache_dir, links=links)
+    if args.verbose:
+        print(f'downloader for {link_file} initialized with skip {skip} and limit {limit}')
+    chunk_size = args.chunk_size if args.stream else None
+    done = lambda url: mark_loaded(url, dataset, manifest.get(url), conn)
+
+    if args.workers:
+        run_pipeline(dl, transform, load, args.workers,
+                     chunk_size=chunk_size, staging_dir=args.staging_dir, done=done, verbose=args.verbose)
+    else:
+        while (dl.size()):
+            url, path = dl.next_path()
+            for data in process_partition(process, url, path, chunk_size, args.staging_dir):
+                if args.verbose:
+                    print('file processed')
+                load(data)
+            done(url)
+    dl.close()
+
+def ingest_staged(link_file, manifest_file, dataset, skip, limit, load, args, conn=None):
+    """Loads one link file's partitions from the Parquet staging area, without downloading or parsing JSON."""
+    manifest = load_manifest(manifest_file)
+    staging = Staging(args.staging_dir or STAGING_DIR)
+    for url in read_links(link_file, skip, limit):
+        if not staging.has(url):
+            print(f'not staged, skipping: {url}')
+            continue
+        if args.verbose:
+            print(f'loading staged {url}')
+        for data in staging.read(url):
+            load(data)
+        mark_loaded(url, dataset, manifest.get(url), conn)
 
 def main():
     parser = argparse.ArgumentParser()
@@ -16,49 +116,76 @@ def main():
     parser.add_argument('--event_limit', type=int, default=1600, help="maximum event files to read")
     parser.add_argument('--label_skip', type=int, default=0, help="number of label files to skip")
     parser.add_argument('--event_skip', type=int, default=0, help="number of event files to skip")
+    parser.add_argument('--download_workers', type=int, default=DOWNLOAD_WORKERS, help="number of concurrent downloads")
+    parser.add_argument('--prefetch', type=int, default=DOWNLOAD_PREFETCH, help="number of files to download ahead of processing")
+    parser.add_argument('--cache_dir', type=str, default=CACHE_DIR, help="directory for cached downloads")
+    parser.add_argument('--stream', action="store_true", help="parses files incrementally, in chunks of --chunk_size records")
+    parser.add_argument('--chunk_size', type=int, default=STREAM_CHUNK_SIZE, help="records per chunk in stream mode")
+    parser.add_argument('--copy', action="store_true", help="bulk-loads tables with COPY instead of INSERT")
+    parser.add_argument('--workers', type=int, default=0, help="runs the staged pipeline with N transform processes")
+    parser.add_argument('--staging_dir', type=str, default=None, help="also writes processed files to this Parquet staging directory")
+    parser.add_argument('--from_staging', '--from-staging', action="store_true", help="loads from the Parquet staging directory instead of downloading")
+    parser.add_argument('--incremental', action="store_true", help="loads only new or changed partitions, per the linkgen.py manifests")
+    parser.add_argument('--deferred_indexes', action="store_true", help="with --init, builds keys and indexes after the load instead of before")
+    parser.add_argument('--unlogged', action="store_true", help="with --init, loads into UNLOGGED tables and makes them logged afterwards")
     parser.add_argument('--verbose', action="store_true", help="enables verbose output")
 
     args = parser.parse_args()
+    if (args.deferred_indexes or args.unlogged) and not args.init:
+        parser.error("--deferred_indexes and --unlogged need --init")
+    if args.deferred_indexes and args.incremental:
+        parser.error("--incremental needs the keys that --deferred_indexes postpones")
 
     if args.init:
-        init_schema()
+        init_schema(deferred=args.deferred_indexes, unlogged=args.unlogged)
         if args.verbose:
             print("schema initialized")
+    else:
+        # a database set up by an earlier version may lack tables and columns this load writes to
+        migrate_schema()
+        if args.verbose:
+            print("schema migrated")
+
+    # Loaded once per run, then kept current as partitions are inserted
+    keymap = KeyMap.load() if not args.event_off else None
+
+    # A single loader (pipeline or staging) reuses one connection for every insert
+    conn = get_db_conn() if args.workers or args.from_staging else None
+
+    load_label = partial(load_labels, args=args, keymap=keymap, conn=conn)
+    load_event = partial(load_events, args=args, keymap=keymap, conn=conn)
 
     if not args.label_off:
-        label_dl = Downloader(LABEL_LINK_FILE, args.label_skip, args.label_limit)
-        if args.verbose:
-            print(f'label downloader initialized with skip {args.label_skip} and limit {args.label_limit}')
-        while (label_dl.size()):
-            data = process_label_json(label_dl.get())
-            if args.verbose:
-                print('file processed')
-            if isinstance(data, pd.DataFrame):
-                insert_data('drugs', data)
-                if args.verbose:
-                    print('data uploaded')
-            elif args.verbose:
-                print('No valid data found')
+        if args.from_staging:
+            ingest_staged(LABEL_LINK_FILE, LABEL_MANIFEST_FILE, 'label', args.label_skip, args.label_limit, load_label, args, conn)
+        else:
+            ingest(LABEL_LINK_FILE, LABEL_MANIFEST_FILE, 'label', args.label_skip, args.label_limit,
+                   process_label_json, transform_labels, load_label, args, conn)
 
     if not args.event_off:
-        event_dl = Downloader(EVENT_LINK_FILE, args.event_skip, args.event_limit)
+        if args.from_staging:
+            ingest_staged(EVENT_LINK_FILE, EVENT_MANIFEST_FILE, 'event', args.event_skip, args.event_limit, load_event, args, conn)
+        else:
+            ingest(EVENT_LINK_FILE, EVENT_MANIFEST_FILE, 'event', args.event_skip, args.event_limit,
+                   process_event_json, transform_events, load_event, args, conn)
+
+    if conn is not None:
+        conn.close()
+
+    if args.deferred_indexes or args.unlogged:
+        finalize_schema(indexes=args.deferred_indexes, unlogged=args.unlogged)
         if args.verbose:
-            print(f'event downloader initialized with skip {args.event_skip} and limit {args.event_limit}')
-        while (event_dl.size()):
-            data = process_event_json(event_dl.get())
-            if args.verbose:
-                print('file processed')
-            dr = data.pop('drugreports')
-            for name, table in data.items():
-                if name == "reactions":
-                    table = construct_linked_df(table)
-                insert_data(name, table)
-                if args.verbose:
-                    print(f'inserted into {name}')
-            insert_dr(dr)
-            if args.verbose:
-                print('inserted into drugreports')
-                print('data uploaded')
+            print("keys and indexes built")
+
+    # a fresh schema has no readers to keep serving, so only incremental loads refresh concurrently
+    refresh_views(concurrently=not args.init)
+    if args.verbose:
+        print("materialized views refreshed")
+
+    # invalidates the webapp's cached results
+    version = bump_data_version()
+    if args.verbose:
+        print(f"data version {version}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
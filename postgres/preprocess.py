@@ -1,9 +1,10 @@
 import pandas as pd
+import psycopg2.extras
 
 from config import REPORT_COLS, PATIENT_COLS, REACTION_COLS, DRUGREPORT_COLS, REPORT_BOOL_COLS
 from config import LABEL_COLS, OPENFDA_COLS
-from config import SCHEMA_FILEPATH, POSTGRES_SCHEMA
-from helpers import get_db_conn, convert_boolean, drop_invalid_dict_rows, convert_age
+from config import SCHEMA_FILEPATH, INDEX_FILEPATH, VIEWS_FILEPATH, MIGRATION_FILEPATH, POSTGRES_SCHEMA, BULK_TABLES, MATERIALIZED_VIEWS
+from helpers import get_db_conn, convert_boolean, drop_invalid_dict_rows, list_min, to_copy_buffer
 
 def process_label_json(data):
     raw_df = pd.DataFrame(data)
@@ -22,9 +23,7 @@ def process_label_json(data):
     openfda = pd.json_normalize(labels['openfda'], errors='ignore')
     openfda['drugid'] = labels['drugid'].reset_index(drop=True)
     openfda['administration_route'] = openfda['route']
-    openfda['spl_id_primary'] = openfda['spl_id'].apply(
-        lambda x: min(x) if isinstance(x, list) and x else None
-    )
+    openfda['spl_id_primary'] = list_min(openfda['spl_id'])
     openfda = openfda[OPENFDA_COLS]
 
     # PHASE TWO: fix dtypes
@@ -36,55 +35,66 @@ def process_label_json(data):
 
     return labels_full
 
+def flatten_events(data):
+    """
+    Walks each event record once, emitting column-oriented rows for all three event tables.
+
+    Returns three dicts of column -> list of values (reports, reactions, drugreports).
+    Report and reaction columns that never appear in `data` are omitted, except the
+    boolean seriousness columns, which are absent from the JSON when not set. Reaction and
+    drugreport rows also get a `record` column: the position of their report row, which
+    `upsert_events` uses to keep only the rows of the report versions it keeps.
+    """
+    reports = {col: [] for col in REPORT_COLS + PATIENT_COLS}
+    reactions = {col: [] for col in REACTION_COLS + ['record']}
+    drugreports = {col: [] for col in DRUGREPORT_COLS + ['record']}
+    seen = set(REPORT_BOOL_COLS)
+
+    for i, record in enumerate(data):
+        patient = record.get('patient') or {}
+        safetyreportid = record.get('safetyreportid')
+        seen.update(record)
+        seen.update(patient)
+
+        # report row: report-level fields plus patient fields
+        for col in REPORT_COLS:
+            reports[col].append(record.get(col))
+        for col in PATIENT_COLS:
+            reports[col].append(patient.get(col))
+
+        # one reaction row per reaction (a blank one if the patient lists none)
+        for reaction in patient.get('reaction') or [{}]:
+            seen.update(reaction)
+            for col in REACTION_COLS:
+                reactions[col].append(safetyreportid if col == 'safetyreportid' else reaction.get(col))
+            reactions['record'].append(i)
+
+        # one drugreport row per drug, keyed by the drug's primary SPL id
+        for drug in patient.get('drug') or [{}]:
+            spl_id = (drug.get('openfda') or {}).get('spl_id')
+            drugreports['safetyreportid'].append(safetyreportid)
+            drugreports['spl_id_primary'].append(min(spl_id) if type(spl_id) is list and spl_id else None)
+            drugreports['drugcharacterization'].append(drug.get('drugcharacterization'))
+            drugreports['record'].append(i)
+
+    reports = {col: values for col, values in reports.items() if col in seen}
+    reactions = {col: values for col, values in reactions.items() if col in seen or col in ('safetyreportid', 'record')}
+
+    return reports, reactions, drugreports
+
 def process_event_json(data):
     """Processes list of dictionaries to DBMS-friendly format."""
-    raw_df = pd.DataFrame(data)
-
-    # PHASE ONE: create tables
-
-    # step 1: select report cols
-    reports = raw_df[list(set(REPORT_COLS) & set(raw_df.columns))]
-
-    # step 2: select patient cols
-    patient_df = pd.json_normalize(raw_df['patient'])
-    patient_df = convert_age(patient_df)
-    patient_df = patient_df[list(set(PATIENT_COLS) & set(patient_df.columns))]
-    reports = pd.concat([reports, patient_df], axis=1)
-    
-    # step 3: create reactions table
-    patient_df = pd.json_normalize(raw_df['patient'])
-    patient_df['safetyreportid'] = raw_df['safetyreportid']
-
-    reactions_exploded = patient_df.copy()  # Keep 'patient' data
-    reactions_exploded = reactions_exploded.explode('reaction').reset_index(drop=True)
-    reactions_normalized = pd.json_normalize(reactions_exploded['reaction'])
-    reactions = pd.concat([reactions_exploded.drop(columns=['reaction']), reactions_normalized], axis=1)
-    reactions = reactions[list(set(REACTION_COLS) & set(reactions.columns))]
-
-    # step 4: create drugs table
-    # drugs = pd.json_normalize(patient_df['drug'].explode())
-    # drugs = rename_columns(drugs, 'openfda.')
-    # drugs['activesubstance'] = drugs['activesubstance.activesubstancename']
-    # drugs['administration_route'] = drugs['route']
-    # drugs = drugs[DRUG_COLS]
-    # drugs = drugs.drop_duplicates(['activesubstance']).dropna(subset=['activesubstance'])
-
-    # step 5: create drugreports table
-    drugreports = patient_df.explode('drug').reset_index(drop=True)
-    dr_normalized = pd.json_normalize(drugreports['drug'])
-    drugreports = pd.concat([dr_normalized, drugreports.drop(columns=['drug'])], axis=1)
-    drugreports['spl_id_primary'] = drugreports['openfda.spl_id'].apply(
-        lambda x: min(x) if isinstance(x, list) and x else None
-    )
-    drugreports = drugreports[DRUGREPORT_COLS]
-    # drugreports = drugreports.drop_duplicates()
+    # PHASE ONE: create tables (reports, reactions, drugreports) in a single pass
+    reports, reactions, drugreports = flatten_events(data)
+    reports = pd.DataFrame(reports)
+    reactions = pd.DataFrame(reactions)
+    drugreports = pd.DataFrame(drugreports)
 
     # PHASE TWO: fix dtypes
 
     # step 1: fill nans
     reports = reports.where(pd.notnull(reports), None)
     reactions = reactions.where(pd.notnull(reactions), None)
-    # drugs = drugs.where(pd.notnull(drugs), None)
     drugreports = drugreports.where(pd.notnull(drugreports), None).drop_duplicates()
 
     # step 2: booleans
@@ -92,10 +102,17 @@ def process_event_json(data):
 
     return {'reports': reports, 'reactions': reactions, 'drugreports': drugreports}
 
-def insert_data(table_name, data):
-    """Inserts a Pandas DataFrame into a PostgreSQL table."""
+def insert_data(table_name, data, use_copy=False, conn=None, on_conflict=None):
+    """
+    Inserts a Pandas DataFrame into a PostgreSQL table, via COPY if `use_copy` is set.
+
+    Uses `conn` if given (left open for the caller), otherwise opens its own connection.
+    If `on_conflict` names the table's key column(s), rows whose key already exists are skipped.
+    """
     # Connect to the database
-    conn = get_db_conn()
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_conn()
     cur = conn.cursor()
 
     # Convert NaN/None to None (Postgres will interpret these as NULL)
@@ -107,56 +124,148 @@ def insert_data(table_name, data):
 
     # Extract column names from DataFrame
     columns = ', '.join(data.columns)  
-    placeholders = ', '.join(['%s'] * len(data.columns))  
+    conflict = f" ON CONFLICT ({on_conflict}) DO NOTHING" if on_conflict else ""
+
+    if use_copy and on_conflict:
+        # COPY can't skip conflicts, so load a temp table and merge from it
+        cur.execute(f"CREATE TEMP TABLE incoming_{table_name} (LIKE openfda.{table_name}) ON COMMIT DROP")
+        copy_data(cur, f"incoming_{table_name}", data)
+        cur.execute(f"INSERT INTO openfda.{table_name} ({columns}) SELECT {columns} FROM incoming_{table_name}{conflict}")
+    elif use_copy:
+        copy_data(cur, f"openfda.{table_name}", data)
+    else:
+        placeholders = ', '.join(['%s'] * len(data.columns))  
 
-    insert_query = f"INSERT INTO openfda.{table_name} ({columns}) VALUES ({placeholders})"
+        insert_query = f"INSERT INTO openfda.{table_name} ({columns}) VALUES ({placeholders}){conflict}"
 
-    # Convert DataFrame to list of tuples
-    records = data.itertuples(index=False, name=None)
+        # Convert DataFrame to list of tuples
+        records = data.itertuples(index=False, name=None)
 
-    # Execute batch insert
-    cur.executemany(insert_query, records)
+        # Execute batch insert
+        cur.executemany(insert_query, records)
 
     # Commit and close
     conn.commit()
     cur.close()
-    conn.close()
+    if own_conn:
+        conn.close()
+
+def insert_dr(dr, use_copy=False, keymap=None, conn=None):
+    """
+    Inserts the drugreports DataFrame into corresponding PostgreSQL table.
 
-def insert_dr(dr):
-    """Inserts the drugreports DataFrame into corresponding PostgreSQL table."""
+    If a KeyMap is given, reportids and drugids are resolved from it instead of
+    being re-read from openfda.reports and openfda.drugs. Uses `conn` if given.
+    """
     # Connect to the database
-    conn = get_db_conn()
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_conn()
     cur = conn.cursor()
 
     # Convert NaN to None (Postgres will interpret these as NULL)
-    dr = construct_linked_df(dr)
+    dr = construct_linked_df(dr, keymap)
     dr = dr.where(pd.notnull(dr), None)  # Replaces NaNs with None (NULL in PostgreSQL)
 
-    # Step 1: Fetch drugid <-> activesubstance mapping from openfda.drugs
-    cur.execute("SELECT drugid, spl_id_primary FROM openfda.drugs;")
-    drug_map = pd.DataFrame(cur.fetchall(), columns=['drugid', 'spl_id_primary'])
+    if keymap is not None:
+        merged = keymap.link_drugs(dr)
+    else:
+        # Step 1: Fetch drugid <-> activesubstance mapping from openfda.drugs
+        cur.execute("SELECT drugid, spl_id_primary FROM openfda.drugs;")
+        drug_map = pd.DataFrame(cur.fetchall(), columns=['drugid', 'spl_id_primary'])
 
-    # Step 2: Merge with `dr` to get corresponding drugid
-    merged = dr.merge(drug_map, on='spl_id_primary', how='left')
+        # Step 2: Merge with `dr` to get corresponding drugid
+        merged = dr.merge(drug_map, on='spl_id_primary', how='left')
 
     # Step 3: Keep only necessary columns
     insert_df = merged[['reportid', 'drugid', 'drugcharacterization']]
     insert_df = insert_df.dropna().drop_duplicates() #remove nas and duplicates
 
-    # Convert DataFrame to list of tuples
-    records = insert_df.itertuples(index=False, name=None)
-
     # Step 4: Insert into drugreports
-    insert_query = "INSERT INTO openFDA.drugreports (reportid, drugid, characterization) VALUES (%s, %s, %s);"
-    cur.executemany(insert_query, records)
+    if use_copy:
+        insert_df = insert_df.rename(columns={'drugcharacterization': 'characterization'})
+        copy_data(cur, "openfda.drugreports", insert_df)
+    else:
+        # Convert DataFrame to list of tuples
+        records = insert_df.itertuples(index=False, name=None)
+
+        insert_query = "INSERT INTO openFDA.drugreports (reportid, drugid, characterization) VALUES (%s, %s, %s);"
+        cur.executemany(insert_query, records)
 
     # Commit and close
     conn.commit()
     cur.close()
-    conn.close()
+    if own_conn:
+        conn.close()
+
+def copy_data(cur, table, data):
+    """Bulk-loads a DataFrame into `table` with COPY ... FROM STDIN."""
+    columns = ', '.join(data.columns)
+    buf = to_copy_buffer(data)
+    cur.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buf)
+
+def supersede_reports(reports, conn=None):
+    """
+    Prepares an incoming reports DataFrame for an upsert on `safetyreportid`.
+
+    Stored reports with the same or an older `safetyreportversion` are deleted, together with
+    their reactions and drugreports, so the incoming version replaces them. Incoming reports
+    older than the stored version are left out.
+
+    Returns:
+        The set of incoming safetyreportids to skip because a newer version is already stored.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_conn()
+    cur = conn.cursor()
+
+    versions = pd.to_numeric(reports['safetyreportversion'], errors='coerce').fillna(0).astype(int)
+    incoming = (pd.DataFrame({'safetyreportid': reports['safetyreportid'], 'safetyreportversion': versions})
+                .sort_values('safetyreportversion')
+                .drop_duplicates('safetyreportid', keep='last'))
+
+    cur.execute("""
+        CREATE TEMP TABLE incoming_reports (safetyreportid TEXT PRIMARY KEY, safetyreportversion INT) ON COMMIT DROP;
+    """)
+    psycopg2.extras.execute_values(
+        cur, "INSERT INTO incoming_reports VALUES %s", incoming.itertuples(index=False, name=None)
+    )
+
+    # Incoming reports that are older than what is already stored
+    cur.execute("""
+        SELECT DISTINCT i.safetyreportid
+        FROM incoming_reports i
+        JOIN openfda.reports r USING (safetyreportid)
+        WHERE COALESCE(r.safetyreportversion, 0) > i.safetyreportversion;
+    """)
+    stale = {row[0] for row in cur.fetchall()}
+
+    # Stored reports the incoming ones supersede
+    cur.execute("""
+        CREATE TEMP TABLE superseded_reports ON COMMIT DROP AS
+        SELECT r.reportid
+        FROM openfda.reports r
+        JOIN incoming_reports i USING (safetyreportid)
+        WHERE COALESCE(r.safetyreportversion, 0) <= i.safetyreportversion
+          AND i.safetyreportid <> ALL(%s);
+    """, (list(stale),))
+    cur.execute("DELETE FROM openfda.reactions WHERE reportid IN (SELECT reportid FROM superseded_reports);")
+    cur.execute("DELETE FROM openfda.drugreports WHERE reportid IN (SELECT reportid FROM superseded_reports);")
+    cur.execute("DELETE FROM openfda.reports WHERE reportid IN (SELECT reportid FROM superseded_reports);")
+
+    conn.commit()
+    cur.close()
+    if own_conn:
+        conn.close()
+
+    return stale
+
+def construct_linked_df(df, keymap=None):
+    """Replaces `safetyreportid` with the latest matching `reportid` (from `keymap` if given)."""
+    if keymap is not None:
+        return keymap.link_reports(df)
 
-def construct_linked_df(df):
-    """Inserts the reactions DataFrame into corresponding PostgreSQL table."""
     # Connect to the database
     conn = get_db_conn()
     cur = conn.cursor()
@@ -180,19 +289,84 @@ def construct_linked_df(df):
 
     return insert_df
 
-def init_schema():
+def init_schema(deferred=False, unlogged=False):
+    """
+    Creates the openfda schema, dropping any existing one.
+
+    With `deferred`, the tables are left without their keys, foreign keys and secondary
+    indexes so a bulk load doesn't maintain them row by row; call `finalize_schema()` once
+    the load is done. With `unlogged`, the bulk tables skip the write-ahead log until then.
+    """
     # Delete schema if needed
     drop_schema_if_exists()
 
-    # Connect to the database
+    # Read schema file
+    with open(SCHEMA_FILEPATH, 'r') as f:
+        sql = f.read()
+    if unlogged:
+        for table in BULK_TABLES:
+            sql = sql.replace(f'CREATE TABLE openfda.{table} ', f'CREATE UNLOGGED TABLE openfda.{table} ')
+    with open(VIEWS_FILEPATH, 'r') as f:
+        sql += '\n' + f.read()
+
+    run_sql(sql)
+    if not deferred:
+        finalize_schema()
+
+def finalize_schema(indexes=True, unlogged=False):
+    """Builds the keys, foreign keys and indexes from indexes.sql, and/or makes UNLOGGED tables logged."""
+    sql = ''
+    if indexes:
+        with open(INDEX_FILEPATH, 'r') as f:
+            sql = f.read()
+    if unlogged:
+        # referenced tables first: a logged table can't reference an unlogged one
+        sql = ''.join(f'ALTER TABLE openfda.{table} SET LOGGED;\n' for table in BULK_TABLES) + sql
+    run_sql(sql)
+
+def migrate_schema():
+    """
+    Adds what newer versions of schema.sql create to an existing schema (migrate.sql), and
+    replaces plain `medications`/`med_counts` views with the materialized ones (views.sql).
+    Safe to run on any schema.
+    """
+    with open(MIGRATION_FILEPATH, 'r') as f:
+        run_sql(f.read())
+
     conn = get_db_conn()
     cur = conn.cursor()
+    cur.execute("SELECT matviewname FROM pg_matviews WHERE schemaname = %s;", (POSTGRES_SCHEMA,))
+    materialized = {row[0] for row in cur.fetchall()}
+    cur.close()
+    conn.close()
 
-    # Read and execute schema file
-    with open(SCHEMA_FILEPATH, 'r') as f:
-        sql = f.read()
+    if not set(MATERIALIZED_VIEWS) <= materialized:
+        # created from the loaded tables, so they are populated before the load refreshes them
+        sql = ''.join(f'DROP VIEW IF EXISTS openfda.{view};\n' for view in MATERIALIZED_VIEWS if view not in materialized)
+        with open(VIEWS_FILEPATH, 'r') as f:
+            run_sql(sql + f.read())
+
+def refresh_views(concurrently=False):
+    """
+    Recomputes the materialized views (`medications`, `med_counts`) from the loaded tables.
+
+    A plain refresh locks the views while it runs; with `concurrently`, readers (e.g. the
+    webapp's autocomplete) keep seeing the old contents until it is done, at some extra cost.
+    """
+    mode = 'CONCURRENTLY ' if concurrently else ''
+    run_sql(''.join(
+        f'REFRESH MATERIALIZED VIEW {mode}openfda.{view};\nANALYZE openfda.{view};\n' for view in MATERIALIZED_VIEWS
+    ))
+
+def run_sql(sql):
+    """Executes a script of semicolon-separated statements in one transaction."""
+    # Connect to the database
+    conn = get_db_conn()
+    cur = conn.cursor()
 
-    # Split commands by semicolon and execute each (ignoring empty ones)
+    # Drop comment lines (a semicolon in one would split a statement), then split
+    # commands by semicolon and execute each (ignoring empty ones)
+    sql = '\n'.join(line for line in sql.splitlines() if not line.lstrip().startswith('--'))
     commands = [cmd.strip() for cmd in sql.split(';') if cmd.strip()]
     for command in commands:
         cur.execute(command)
@@ -23,16 +23,15 @@ CREATE TABLE openfda.reports (
 );
 
 CREATE TABLE openfda.reactions (
-    reactionid SERIAL PRIMARY KEY,
+    reactionid SERIAL,
     reportid INT,
     reactionmeddraversionpt VARCHAR(10),
     reactionmeddrapt TEXT,
-    reactionoutcome SMALLINT,
-    FOREIGN KEY (reportid) REFERENCES openfda.reports(reportid)
+    reactionoutcome SMALLINT
 );
 
 CREATE TABLE openfda.drugs (
-    drugid TEXT PRIMARY KEY,
+    drugid TEXT NOT NULL,
     spl_product_data_elements TEXT[], 
     indications_and_usage TEXT[], 
     dosage_and_administration TEXT[], 
@@ -112,33 +111,32 @@ CREATE TABLE openfda.drugs (
     nui TEXT[], 
     pharm_class_epc TEXT[], 
     pharm_class_moa TEXT[], 
-    unii TEXT[]
+    unii TEXT[],
+    ingested_at TIMESTAMP DEFAULT now()   -- lets search/name_resolver.py pick up new labels
 );
 
 CREATE TABLE openfda.drugreports (
     drugid TEXT NOT NULL,
     reportid INT NOT NULL,
-    characterization INT NOT NULL,
-    PRIMARY KEY (drugid, reportid),
-    FOREIGN KEY (drugid) REFERENCES openfda.drugs(drugid),
-    FOREIGN KEY (reportid) REFERENCES openfda.reports(reportid)
+    characterization INT NOT NULL
 );
 
-CREATE OR REPLACE VIEW openfda.medications AS (
-    SELECT drugid, b AS med_name, 'brand name' AS source, brand_name, generic_name
-    FROM openfda.drugs, unnest(brand_name) AS b
-    WHERE b IS NOT NULL AND b <> ''
-
-    UNION
+CREATE TABLE openfda.loaded_partitions (
+    url TEXT PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    export_date DATE,
+    size_mb REAL,
+    records INT,
+    loaded_at TIMESTAMP NOT NULL DEFAULT now()
+);
 
-    SELECT drugid, g AS med_name, 'generic name' AS source, brand_name, generic_name
-    FROM openfda.drugs, unnest(generic_name) AS g
-    WHERE g IS NOT NULL AND g <> ''
+-- single row, bumped by every ingest (postgres/data_version.py), and the webapp drops cached results when it changes
+CREATE TABLE openfda.data_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT clock_timestamp()
 );
 
-CREATE OR REPLACE VIEW openfda.med_counts AS (
-    SELECT drugid, COUNT(*) AS num_reports
-    FROM openfda.drugreports
-    GROUP BY drugid
-    ORDER BY num_reports DESC, drugid ASC
-);
\ No newline at end of file
+INSERT INTO openfda.data_version (version) VALUES (1);
+
+-- the medications and med_counts materialized views are created by views.sql
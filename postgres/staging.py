@@ -0,0 +1,87 @@
+# columnar (Parquet) staging of processed partitions
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from config import STAGING_DIR
+
+_SOURCES = ['config.py', 'helpers.py', 'preprocess.py']
+
+def processing_version():
+    """Hash of the transform sources. Changing how partitions are processed invalidates old staged output."""
+    sha = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in _SOURCES:
+        with open(os.path.join(here, name), 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()[:16]
+
+PROCESSING_VERSION = processing_version()
+
+def _restore_lists(df):
+    """Parquet list columns read back as numpy arrays; psycopg2 and COPY expect Python lists."""
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = [v.tolist() if isinstance(v, np.ndarray) else v for v in df[col]]
+    return df
+
+class StagingWriter:
+    """Writes the processed chunks of one partition. The partition only becomes visible on `commit()`."""
+    def __init__(self, path, url):
+        self.path = path
+        self.url = url
+        self.parts = 0
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+    def write(self, processed):
+        tables = {'drugs': processed} if isinstance(processed, pd.DataFrame) else (processed or {})
+        for name, df in tables.items():
+            df.to_parquet(os.path.join(self.path, f'part-{self.parts:05d}-{name}.parquet'), index=False)
+        self.parts += 1
+
+    def commit(self):
+        with open(os.path.join(self.path, '_SUCCESS'), 'w', encoding='utf-8') as f:
+            json.dump({'url': self.url, 'parts': self.parts, 'version': PROCESSING_VERSION}, f)
+
+class Staging:
+    """
+    Local Parquet copies of processed partitions (`reports`, `reactions`, `drugreports`, `drugs`).
+
+    Each partition is stored under `<root>/<processing version>/<sha256(url)>/`, so
+    `--from_staging` can rebuild the database without any network access or JSON parsing.
+    """
+    def __init__(self, root=STAGING_DIR):
+        self.root = os.path.join(root, PROCESSING_VERSION)
+
+    def path(self, url):
+        return os.path.join(self.root, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def has(self, url):
+        return os.path.exists(os.path.join(self.path(url), '_SUCCESS'))
+
+    def writer(self, url):
+        return StagingWriter(self.path(url), url)
+
+    def read(self, url):
+        """Yields the staged chunks of `url` in the same shape `process_*_json` returned them."""
+        path = self.path(url)
+        with open(os.path.join(path, '_SUCCESS'), 'r', encoding='utf-8') as f:
+            parts = json.load(f)['parts']
+        files = os.listdir(path)
+        for part in range(parts):
+            prefix = f'part-{part:05d}-'
+            tables = {
+                name[len(prefix):-len('.parquet')]: _restore_lists(pd.read_parquet(os.path.join(path, name)))
+                for name in sorted(files) if name.startswith(prefix)
+            }
+            if not tables:
+                yield None
+            elif list(tables) == ['drugs']:
+                yield tables['drugs']
+            else:
+                yield tables
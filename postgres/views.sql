@@ -0,0 +1,33 @@
+-- Materialized views over the loaded tables, run by init_schema() after schema.sql and by
+-- migrate_schema() on databases that still have the plain views, so it must be safe to run again.
+
+-- Materialized, so autocomplete and name lookups don't re-run the unnests (or the
+-- aggregation) per query. Filled by refresh_views() at the end of every ingest.
+CREATE MATERIALIZED VIEW IF NOT EXISTS openfda.medications AS (
+    SELECT drugid, b AS med_name, 'brand name' AS source, brand_name, generic_name
+    FROM openfda.drugs, unnest(brand_name) AS b
+    WHERE b IS NOT NULL AND b <> ''
+
+    UNION
+
+    SELECT drugid, g AS med_name, 'generic name' AS source, brand_name, generic_name
+    FROM openfda.drugs, unnest(generic_name) AS g
+    WHERE g IS NOT NULL AND g <> ''
+);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS openfda.med_counts AS (
+    SELECT drugid, COUNT(*) AS num_reports
+    FROM openfda.drugreports
+    GROUP BY drugid
+    ORDER BY num_reports DESC, drugid ASC
+);
+
+-- unique indexes let REFRESH ... CONCURRENTLY keep the views readable during an incremental load
+CREATE UNIQUE INDEX IF NOT EXISTS medications_key_idx ON openfda.medications (drugid, med_name, source);
+CREATE UNIQUE INDEX IF NOT EXISTS med_counts_drugid_idx ON openfda.med_counts (drugid);
+
+-- autocomplete: prefix matches on the btree, substring matches on the trigrams
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS medications_med_name_prefix_idx ON openfda.medications (lower(med_name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS medications_med_name_trgm_idx ON openfda.medications USING gin (lower(med_name) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS medications_med_name_idx ON openfda.medications (med_name);
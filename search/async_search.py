@@ -0,0 +1,120 @@
+# asyncio search path: the vector search, label lookups and report enrichment overlap instead of running back to back
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from postgres.pool import connect_params
+from search.config import ES_URL, TOP_K, KNN_NUM_CANDIDATES, EXACT_SEARCH, ASYNC_PG_POOL_SIZE, ENCODE_THREADS
+from search.embeddings import encode_one
+from search.name_resolver import get_resolver
+from search.search import summarize
+from search.search_functions import MED_INFO_SQL, SERIOUS_SQL, REACTIONS_SQL, CHARACTERIZATIONS_SQL, label_warning, fill_report_details
+from search.vector_store import get_store
+
+def numbered(sql):
+    """Rewrites psycopg2 `%s` placeholders as asyncpg's `$1`, `$2`, ..."""
+    parts = sql.split('%s')
+    return parts[0] + ''.join(f'${i}{part}' for i, part in enumerate(parts[1:], 1))
+
+class AsyncSearch:
+    """
+    Runs searches on an event loop in a background thread, so any number of (sync) webapp
+    threads can share one AsyncElasticsearch client and one asyncpg pool.
+
+    Per query, the query embedding (on `ENCODE_THREADS` executor threads, off the loop) and
+    vector search run alongside the drug name resolution and the label lookups of every
+    drug; the three report enrichment queries then run at once on separate connections.
+    Results match `search.execute_query`.
+    """
+    def __init__(self, store=None, pool_size=ASYNC_PG_POOL_SIZE, encode_threads=ENCODE_THREADS):
+        self.store = get_store(store)
+        self.pid = os.getpid()
+        self.executor = ThreadPoolExecutor(encode_threads, thread_name_prefix='encode')
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='async-search', daemon=True)
+        self.thread.start()
+        self.run(self._connect(pool_size, connect_params()))
+
+    async def _connect(self, pool_size, params):
+        # imported here so importing this module (e.g. from the webapp) stays cheap
+        import asyncpg
+        from elasticsearch import AsyncElasticsearch
+
+        self.pg = await asyncpg.create_pool(min_size=1, max_size=pool_size, **params)
+        self.es = AsyncElasticsearch(ES_URL) if self.store.name == 'elasticsearch' else None
+
+    def run(self, coro):
+        """Runs `coro` on the search loop and waits for its result (call from any thread but the loop's)."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def _in_executor(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def search_reports(self, drugnames, top_k=TOP_K, exact=EXACT_SEARCH, num_candidates=KNN_NUM_CANDIDATES, filter=None):
+        """Async `search_functions.search_reports`."""
+        embedding = await self._in_executor(encode_one, f"Reports involving: {', '.join(drugnames)}")
+        if self.es is None:
+            # the local store searches in-process with NumPy
+            return await self._in_executor(lambda: self.store.search(embedding, top_k, exact=exact, num_candidates=num_candidates, filter=filter))
+        results = await self.es.search(index=self.store.index_name, body=self.store.query_body(embedding, top_k, exact, num_candidates, filter))
+        return self.store.parse_hits(results)
+
+    async def _fetch(self, sql, *args):
+        async with self.pg.acquire() as conn:
+            return await conn.fetch(numbered(sql), *args)
+
+    async def get_med_info(self, drugname):
+        """Async `search_functions.get_med_info`."""
+        rows = await self._fetch(MED_INFO_SQL, drugname.strip().lower())
+        return label_warning(tuple(rows[0]) if rows else None)
+
+    async def get_report_details(self, reportids):
+        """Async `search_functions.get_report_details`, with the three queries in parallel."""
+        reportids = [int(rid) for rid in reportids]
+        details = {rid: {"serious": None, "reactions": [], "characterizations": {}} for rid in reportids}
+        if reportids:
+            rows = await asyncio.gather(*(self._fetch(sql, reportids) for sql in (SERIOUS_SQL, REACTIONS_SQL, CHARACTERIZATIONS_SQL)))
+            fill_report_details(details, *rows)
+        return details
+
+    async def execute_query(self, drugnames):
+        """Async `search.execute_query`."""
+        return (await self.interaction_results(drugnames, labels=False))[1]
+
+    async def interaction_results(self, drugnames, labels=True):
+        """
+        Label warnings (drug name -> warning, if `labels`) and the `execute_query` results
+        for `drugnames`, with the label lookups running alongside the search.
+        """
+        labelled = list(drugnames) if labels else []   # warnings keyed by the names as given, as in compute_results
+        drugnames = [d.lower() for d in drugnames]
+        resolver = get_resolver()
+        results, target_drugids, *warnings = await asyncio.gather(
+            self.search_reports(drugnames),
+            self._in_executor(resolver.resolve_many, drugnames),   # may refresh over psycopg2
+            *(self.get_med_info(name) for name in labelled),
+        )
+        details = await self.get_report_details([entry["reportid"] for entry in results])
+        return dict(zip(labelled, warnings)), summarize(results, details, target_drugids)
+
+    def close(self):
+        async def _close():
+            await self.pg.close()
+            if self.es is not None:
+                await self.es.close()
+        self.run(_close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown()
+
+_async_search = None
+_async_search_lock = threading.Lock()
+
+def get_async_search():
+    """The process-wide AsyncSearch, started on first use. A forked worker gets its own."""
+    global _async_search
+    with _async_search_lock:
+        if _async_search is None or _async_search.pid != os.getpid():
+            _async_search = AsyncSearch()
+        return _async_search
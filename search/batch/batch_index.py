@@ -1,43 +1,68 @@
-from sys import argv
+import argparse
+import time
 
-from text_utils import create_synthetic_text
-from index_utils import index_to_elasticsearch, init_es, embed_text, get_reports, check_init
-
-INDEX_LIMIT_DEFAULT = 1000
+from postgres.data_version import bump_data_version
+from search.config import VECTOR_STORE, IVF_NLIST, INDEX_LIMIT_DEFAULT, REPORT_BATCH_SIZE, ENCODE_BATCH_SIZE, ENCODE_WORKERS, BULK_CHUNK_SIZE, BULK_THREADS
+from search.embeddings import get_cache
+from search.vector_store import get_store, STORES
+from search.batch.index_utils import get_reports, start_encoders, stop_encoders, generate_actions, bulk_index, Checkpoint
 
 def main():
-    init = True
-    if len(argv) > 1:
-        if (len(argv) in [3, 4]) and (argv[1] in ['--limit', '-l'] or argv[2] in ['--limit', '-l']):
-            limit = argv[2]
-            print(f'index limit set to {limit}')
-        elif (len(argv) in [2,4]) and (argv[1] in ['--no_init', '-n'] or argv[3] in ['--no_init', '-n']):
-            init = False
-            print(f'init disabled')
-        else:
-            print('USAGE: python search/batch/run_batch_indexing [-l/--limit N]')
-            return 1
-    else:
-        limit = INDEX_LIMIT_DEFAULT
-        print(f'index limit not specified, using default={INDEX_LIMIT_DEFAULT}')
-    
-    if init:
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-l', '--limit', type=int, default=INDEX_LIMIT_DEFAULT, help="maximum reports to index")
+    parser.add_argument('-n', '--no_init', action="store_true", help="adds to the existing index instead of recreating it")
+    parser.add_argument('--store', choices=list(STORES), default=VECTOR_STORE, help="vector store to index into")
+    parser.add_argument('--ivf', type=int, default=IVF_NLIST, help="with --store local, builds N IVF partitions after indexing")
+    parser.add_argument('--incremental', action="store_true", help="keeps the index and only re-embeds new or changed reports (implies --no_init)")
+    parser.add_argument('--resume', action="store_true", help="keeps the index and continues after the last committed batch (implies --no_init)")
+    parser.add_argument('--batch_size', type=int, default=REPORT_BATCH_SIZE, help="reports embedded per batch")
+    parser.add_argument('--encode_batch_size', type=int, default=ENCODE_BATCH_SIZE, help="sentences per forward pass of the model")
+    parser.add_argument('--workers', type=int, default=ENCODE_WORKERS, help="CPU encoder processes (0 encodes in this process)")
+    parser.add_argument('--chunk_size', type=int, default=BULK_CHUNK_SIZE, help="documents per bulk request")
+    parser.add_argument('--bulk_threads', type=int, default=BULK_THREADS, help="concurrent bulk requests")
+
+    args = parser.parse_args()
+    if args.incremental or args.resume:
+        args.no_init = True
+
+    store = get_store(args.store)
+    if not args.no_init:
         print("Initializing index")
-        init_es()
-    elif not check_init():
+        store.reset()
+    elif not store.exists():
         print("Overriding --no_init. REASON: index uninitialized.")
-        init_es
+        store.reset()
+
+    checkpoint = Checkpoint(store.name)
+    start_after = checkpoint.stored if args.resume else 0
+    print(f"Fetching up to {args.limit} reports after reportid {start_after}...")
+    reports = get_reports(limit=args.limit, page_size=args.batch_size, start_after=start_after)
+
+    print("Embedding and indexing...")
+    pool = start_encoders(args.workers)
+    start = time.perf_counter()
+    try:
+        actions = generate_actions(reports, args.batch_size, args.encode_batch_size, pool, args.incremental, checkpoint, store.name)
+        indexed = bulk_index(actions, args.chunk_size, args.bulk_threads, checkpoint, store.name)
+    finally:
+        stop_encoders(pool)
+    elapsed = time.perf_counter() - start
+
+    print(f"Done indexing! {indexed} reports embedded in {elapsed:.1f}s ({indexed / max(elapsed, 1e-9):.1f} docs/sec)")
 
-    print("Fetching reports...")
-    reports = get_reports(limit=limit)
+    if args.store == 'local' and args.ivf:
+        print(f"Building {args.ivf} IVF partitions...")
+        store.build_ivf(args.ivf)
 
-    print("Generating synthetic text...")
-    for report in reports:
-        synthetic_text = create_synthetic_text(report)
-        embedding = embed_text(synthetic_text)
-        index_to_elasticsearch(report["reportid"], synthetic_text, embedding)
+    # search results changed, so cached webapp results are stale
+    if indexed:
+        bump_data_version()
 
-    print("Done indexing!")
+    cache = get_cache()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%}), {stats['size']}/{stats['capacity']} vectors")
 
 if __name__ == "__main__":
     main()
@@ -1,135 +1,227 @@
-from elasticsearch import Elasticsearch
-from sentence_transformers import SentenceTransformer
+from collections import deque
+from itertools import islice
+
 import psycopg2
 import psycopg2.extras
 
-from postgres.auth import Auth
-
-es = Elasticsearch("http://localhost:9200")
-
-index_name = "reports_embeddings"
+from postgres.pool import get_db_conn
+from search.config import ENCODE_BATCH_SIZE, REPORT_BATCH_SIZE, BULK_CHUNK_SIZE, BULK_THREADS
+from search.embeddings import encode, encode_one, text_hash, start_encoders, stop_encoders
+from search.text_utils import create_synthetic_text
+from search.vector_store import get_store
 
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-
-mapping = {
-    "mappings": {
-        "properties": {
-            "reportid": {"type": "keyword"},
-            "text": {"type": "text"},
-            "embedding": {
-                "type": "dense_vector",
-                "dims": 384,
-                "index": True,
-                "similarity": "cosine"
-            }
-        }
-    }
-}
+def check_init(store=None):
+    """Check if the vector store (by default the configured one) is initialized."""
+    return get_store(store).exists()
 
-def check_init():
-    """Check if the ElasticSearch index is initialized."""
-    return es.indices.exists(index=index_name)
+def init_store(store=None):
+    """Initialize the vector store (and reset its high-water mark)."""
+    get_store(store).reset()
 
 def init_es():
-    """Initialize ElasticSearch index."""
-    # Delete the index if it already exists
-    if es.indices.exists(index=index_name):
-        es.indices.delete(index=index_name)
-
-    # Create the index
-    es.indices.create(index=index_name, body=mapping)
-
-print(f"Created Elasticsearch index '{index_name}' for adverse event reports.")
+    """Initialize ElasticSearch index (and reset its high-water mark)."""
+    init_store('elasticsearch')
 
 def embed_text(text):
-    """Embed text using SentenceTransformer."""
-    return model.encode(text).tolist()
+    """Embed text using SentenceTransformer (through the embedding cache)."""
+    return encode_one(text).tolist()
+
+def embed_texts(texts, batch_size=ENCODE_BATCH_SIZE, pool=None, cache=None):
+    """Embeds a list of texts in batches of `batch_size`, across the encoder processes of `pool` if given."""
+    return encode(texts, batch_size, pool, cache)
 
 def index_to_elasticsearch(report_id, synthetic_text, embedding):
     """Add report to ElasticSearch index."""
+    store = get_store('elasticsearch')
     doc = {
         "reportid": report_id,
         "text": synthetic_text,
         "embedding": embedding
     }
-    es.index(index=index_name, id=report_id, body=doc)
-
-def get_reports(limit=1000):
-    """Retrieve batch of results from postgres."""
-    conn = Auth.get_db_conn()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    
-    # 1. Grab base reports
-    cur.execute(f"""
-        SELECT report_id, 
-               serious, 
-               seriousnessdeath, 
-               seriousness, 
-               seriousnesslifethreatening, 
-               seriousnesshospitalization, 
-               seriousnessdisabling, 
-               seriousnesscongenitalanomali, 
-               seriousnessother, 
-               patientonsetage, 
-               patientsex, 
-               patientweight
-        FROM openfda.reports
-        LIMIT %s
-    """, (limit,))
-
-    reports = [dict(row) for row in cur.fetchall()]
-
-    # 2. Build mapping: reportid → reactions
-    cur.execute("""
-        SELECT reportid, reactionmeddrapt, reactionoutcome
-        FROM openfda.reactions
-    """)
-    reaction_map = {}
-    for row in cur.fetchall():
-        reportid = row["reportid"]
-        reactiontype = row["reactionmeddrapt"]
-        reactionoutcome = row["reactionoutcome"]
-        match (reactionoutcome):
-            case 1:
-                reaction = ' '.join([reactiontype, '(recovered)'])
-            case 2:
-                reaction = ' '.join([reactiontype, '(recovering)'])
-            case 3:
-                reaction = ' '.join([reactiontype, '(unresolved)'])
-            case 4:
-                reaction = ' '.join([reactiontype, '(recovered with sequelae)'])
-            case 5:
-                reaction = ' '.join([reactiontype, '(fatal)'])
-            case _:
-                reaction = reactiontype
-        if reportid not in reaction_map:
-            reaction_map[reportid] = []
-        reaction_map[reportid].append(reaction)
-    
-    # 3. Build mapping: reportid → drugs
-    cur.execute("""
-        SELECT dr.reportid, d.brand_name, d.generic_name
-        FROM openfda.drugreports dr
-        JOIN openfda.drugs d ON dr.drugid = d.drugid
-    """)
-    drug_map = {}
-    for row in cur.fetchall():
-        reportid = row["reportid"]
-        drugs = []
-        for name_list in (row["brand_name"], row["generic_name"]):
-            if name_list:
-                drugs.extend(name_list)
-        if reportid not in drug_map:
-            drug_map[reportid] = []
-        drug_map[reportid].extend(d for d in drugs if d)
-
-    cur.close()
-    conn.close()
+    store.es.index(index=store.index_name, id=report_id, body=doc)
+
+def indexed_hashes(reportids, store=None):
+    """Returns reportid -> stored `text_hash` for the given reports that are already indexed."""
+    return get_store(store).hashes(reportids)
+
+class Checkpoint:
+    """
+    High-water mark of the indexer: the last `reportid` whose batch is fully indexed.
+
+    Kept by the vector store (a document in META_INDEX_NAME for ElasticSearch). `generate_actions`
+    marks where each batch ends in its stream of documents, and the store's `index` advances the
+    mark once every document up to that point has been acknowledged, so after a crash the indexer
+    can resume from the last committed batch. `stored` is the mark left by the previous run.
+    """
+    def __init__(self, store=None):
+        self.store = get_store(store)
+        self.emitted = 0
+        self.pending = deque()
+        self.stored = self.store.load_mark()
+
+    def mark(self, last_reportid):
+        """Records that the batch ending at `last_reportid` ends after the documents emitted so far."""
+        self.pending.append((self.emitted, last_reportid))
+
+    def advance(self, indexed):
+        """Saves the mark of the last batch whose documents are all among the first `indexed` acknowledged."""
+        last_reportid = None
+        while self.pending and self.pending[0][0] <= indexed:
+            last_reportid = self.pending.popleft()[1]
+        if last_reportid is not None:
+            self.store.save_mark(last_reportid)
+
+def batched(iterable, size):
+    """Yields lists of up to `size` items from `iterable`."""
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
+
+def generate_actions(reports, report_batch_size=REPORT_BATCH_SIZE, encode_batch_size=ENCODE_BATCH_SIZE, pool=None, incremental=False, checkpoint=None, store=None):
+    """
+    Yields one document (`reportid`, `text`, `text_hash`, `embedding`) per report to index.
+
+    Reports are embedded `report_batch_size` at a time, so the model always sees full
+    batches. The generator is consumed lazily by the store, so the next batch is encoded
+    while the previous one is still being sent.
+
+    With `incremental`, reports whose synthetic text hash matches the indexed one are
+    skipped without being embedded. With a `checkpoint`, the end of every batch is marked.
+    """
+    for batch in batched(reports, report_batch_size):
+        texts = [create_synthetic_text(report) for report in batch]
+        hashes = [text_hash(text) for text in texts]
+        if incremental:
+            stored = indexed_hashes((report["reportid"] for report in batch), store)
+            changed = [i for i, report in enumerate(batch) if stored.get(str(report["reportid"])) != hashes[i]]
+        else:
+            changed = range(len(batch))
+
+        embeddings = embed_texts([texts[i] for i in changed], encode_batch_size, pool) if changed else []
+        for i, embedding in zip(changed, embeddings):
+            if checkpoint is not None:
+                checkpoint.emitted += 1
+            yield {
+                "reportid": batch[i]["reportid"],
+                "text": texts[i],
+                "text_hash": hashes[i],
+                "embedding": embedding
+            }
+        if checkpoint is not None:
+            checkpoint.mark(batch[-1]["reportid"])
+
+def bulk_index(actions, chunk_size=BULK_CHUNK_SIZE, threads=BULK_THREADS, checkpoint=None, store=None):
+    """
+    Indexes documents in chunks of `chunk_size` (with `threads` concurrent bulk requests for ElasticSearch),
+    advancing `checkpoint` (if given) as batches complete.
+
+    Returns:
+        The number of documents indexed.
+    """
+    return get_store(store).index(actions, chunk_size, threads, checkpoint)
+
+REACTION_OUTCOMES = {1: 'recovered', 2: 'recovering', 3: 'unresolved', 4: 'recovered with sequelae', 5: 'fatal'}
+
+def format_reaction(reactiontype, reactionoutcome):
+    """Appends the outcome to a reaction PT, e.g. 'Nausea (recovered)'."""
+    outcome = REACTION_OUTCOMES.get(reactionoutcome)
+    return f'{reactiontype} ({outcome})' if outcome else reactiontype
+
+def read_report_page(start_after, size):
+    """
+    Reads the first `size` reports with `reportid > start_after`, in `reportid` order, each
+    with its `reactions` and `drugnames`. One short transaction on a pooled connection.
+    """
+    conn = get_db_conn()
+    try:
+        reports_cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur = conn.cursor()
+
+        # 1. Base reports
+        reports_cur.execute("""
+            SELECT reportid,
+                   serious,
+                   seriousnessdeath,
+                   seriousnesslifethreatening,
+                   seriousnesshospitalization,
+                   seriousnessdisabling,
+                   seriousnesscongenitalanomali,
+                   seriousnessother,
+                   patientonsetage,
+                   patientsex,
+                   patientweight
+            FROM openfda.reports
+            WHERE reportid > %s
+            ORDER BY reportid
+            LIMIT %s
+        """, (start_after, size))
+        reports = [dict(row) for row in reports_cur.fetchall()]
+        reportids = [report["reportid"] for report in reports]
+
+        # 2. Reactions for this page
+        cur.execute("""
+            SELECT reportid, reactionmeddrapt, reactionoutcome
+            FROM openfda.reactions
+            WHERE reportid = ANY(%s)
+        """, (reportids,))
+        reaction_map = {}
+        for reportid, reactiontype, reactionoutcome in cur.fetchall():
+            reaction_map.setdefault(reportid, []).append(format_reaction(reactiontype, reactionoutcome))
+
+        # 3. Drug names for this page
+        cur.execute("""
+            SELECT dr.reportid, d.brand_name, d.generic_name
+            FROM openfda.drugreports dr
+            JOIN openfda.drugs d ON dr.drugid = d.drugid
+            WHERE dr.reportid = ANY(%s)
+        """, (reportids,))
+        drug_map = {}
+        for reportid, brand_name, generic_name in cur.fetchall():
+            names = drug_map.setdefault(reportid, [])
+            for name_list in (brand_name, generic_name):
+                if name_list:
+                    names.extend(d for d in name_list if d)
+
+        conn.commit()
+        reports_cur.close()
+        cur.close()
+    finally:
+        conn.close()
 
     # 4. Enrich reports with drug + reaction info
     for report in reports:
         rid = report["reportid"]
         report["drugnames"] = drug_map.get(rid, [])
         report["reactions"] = reaction_map.get(rid, [])
-
-    return reports
\ No newline at end of file
+    return reports
+
+def iter_report_pages(limit=None, page_size=REPORT_BATCH_SIZE, start_after=0):
+    """
+    Streams reports from postgres one page at a time, in `reportid` order, starting from
+    `reportid > start_after`.
+
+    Each page is a keyset query (`reportid > last ORDER BY reportid LIMIT page_size`) in its
+    own short transaction, so no snapshot stays open while the caller embeds and indexes a
+    page. Reactions and drug names are fetched for the current page only
+    (`reportid = ANY(...)`), so memory and startup time don't grow with the size of the database.
+
+    Yields:
+        Lists of report dicts, each with its `reactions` and `drugnames`.
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        reports = read_report_page(start_after, size)
+        if not reports:
+            return
+        yield reports
+        if len(reports) < size:
+            return
+        start_after = reports[-1]["reportid"]
+        if remaining is not None:
+            remaining -= len(reports)
+
+def get_reports(limit=1000, page_size=REPORT_BATCH_SIZE, start_after=0):
+    """Streams reports (with metadata) from postgres. See `iter_report_pages`."""
+    for page in iter_report_pages(limit, page_size, start_after):
+        yield from page
@@ -0,0 +1,428 @@
+# benchmarks for the search service, run on synthetic openFDA-shaped reports
+import argparse
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from search.config import (
+    ENCODE_BATCH_SIZE, TOP_K, KNN_NUM_CANDIDATES, IVF_NPROBE, IMPORT_BUDGET_MS,
+    ONNX_QUANTIZATION, ONNX_MIN_COSINE, ONNX_MIN_TOPK_OVERLAP,
+)
+from search.text_utils import create_synthetic_text
+
+REACTIONS = ['Nausea', 'Headache (recovered)', 'Rash (recovering)', 'Dizziness', 'Death (fatal)', 'Fatigue (unresolved)']
+DRUGS = ['ASPIRIN', 'IBUPROFEN', 'METFORMIN', 'LISINOPRIL', 'ATORVASTATIN', 'WARFARIN', 'SERTRALINE', 'OMEPRAZOLE']
+
+def make_reports(n, seed=0):
+    """Generates `n` synthetic reports shaped like the output of `index_utils.get_reports`."""
+    rng = random.Random(seed)
+    reports = []
+    for i in range(n):
+        serious = rng.random() < 0.5
+        reports.append({
+            'reportid': i + 1,
+            'serious': serious,
+            'seriousnessdeath': serious and rng.random() < 0.1,
+            'seriousnesshospitalization': serious and rng.random() < 0.5,
+            'seriousnessother': serious and rng.random() < 0.3,
+            'patientonsetage': rng.randint(1, 90),
+            'patientsex': rng.choice([0, 1, 2]),
+            'patientweight': round(rng.uniform(3, 120), 1),
+            'reactions': rng.sample(REACTIONS, rng.randint(1, 3)),
+            'drugnames': rng.sample(DRUGS, rng.randint(1, 4)),
+        })
+    return reports
+
+def throughput(name, fn, texts):
+    """Runs `fn(texts)` and prints its throughput in docs/sec."""
+    start = time.perf_counter()
+    fn(texts)
+    elapsed = time.perf_counter() - start
+    print(f'{name:<32} {elapsed:8.2f}s   {len(texts) / elapsed:9.1f} docs/sec')
+    return elapsed
+
+def bench_encoding(texts, batch_size=ENCODE_BATCH_SIZE, workers=0, single=1000):
+    """Compares one-at-a-time encoding (as the indexer used to) with batched and multi-process encoding, all uncached."""
+    from search.embeddings import get_model, encode, start_encoders, stop_encoders
+
+    single = texts[:single]
+    throughput(f'one at a time ({len(single)} docs)', lambda t: [get_model().encode(x) for x in t], single)
+    throughput(f'batched (batch_size={batch_size})', lambda t: encode(t, batch_size, cache=False), texts)
+    if workers:
+        pool = start_encoders(workers)
+        try:
+            throughput(f'{workers} workers (batch_size={batch_size})', lambda t: encode(t, batch_size, pool, cache=False), texts)
+        finally:
+            stop_encoders(pool)
+
+def bench_cache(texts, batch_size=ENCODE_BATCH_SIZE):
+    """Encodes the same texts through a fresh embedding cache twice: cold (all misses), then warm."""
+    from search.embeddings import encode
+    from search.embedding_cache import EmbeddingCache
+
+    with tempfile.TemporaryDirectory() as path:
+        cache = EmbeddingCache(path, capacity=len(texts))
+        throughput('cache cold', lambda t: encode(t, batch_size, cache=cache), texts)
+        throughput('cache warm', lambda t: encode(t, batch_size, cache=cache), texts)
+        stats = cache.stats()
+        print(f'{"  cache":<32} {stats["hits"]} hits   {stats["misses"]} misses   {stats["size"]} vectors')
+        cache.close()
+
+def bench_onnx(texts, queries, batch_size=ENCODE_BATCH_SIZE, top_k=TOP_K, quantization=ONNX_QUANTIZATION):
+    """
+    Compares the PyTorch, ONNX and int8 ONNX backends on CPU: sentences/sec, and parity with
+    PyTorch as the cosine similarity of each text's embeddings and the overlap of the top-k
+    texts per query. Returns False if a backend is below ONNX_MIN_COSINE or ONNX_MIN_TOPK_OVERLAP.
+    """
+    import numpy as np
+    from search.embeddings import load_model
+
+    backends = [('torch', None), ('onnx', None)] + ([('onnx', quantization)] if quantization else [])
+    query_texts = [f"Reports involving: {', '.join(query)}" for query in queries]
+    reference = None
+    ok = True
+    for backend, q in backends:
+        name = 'torch' if backend == 'torch' else f'onnx {f"qint8_{q}" if q else "fp32"}'
+        model = load_model(backend, q)
+        model.encode(texts[:batch_size], batch_size=batch_size)   # warm-up
+
+        start = time.perf_counter()
+        docs = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+        elapsed = time.perf_counter() - start
+        top = np.argsort(-(model.encode(query_texts, normalize_embeddings=True) @ docs.T), axis=1)[:, :top_k]
+
+        line = f'{name:<24} {elapsed:8.2f}s   {len(texts) / elapsed:9.1f} sentences/sec'
+        if reference is None:
+            reference = docs, top
+        else:
+            cosine = np.sum(docs * reference[0], axis=1)
+            overlap = statistics.mean(len(set(a) & set(b)) / top_k for a, b in zip(top, reference[1]))
+            line += f'   cosine mean {cosine.mean():.4f} min {cosine.min():.4f}   top-{top_k} overlap {overlap:.3f}'
+            if cosine.mean() < ONNX_MIN_COSINE or overlap < ONNX_MIN_TOPK_OVERLAP:
+                line += '   (below parity)'
+                ok = False
+        print(line)
+    return ok
+
+def make_queries(n, seed=0):
+    """Generates `n` drug-combination queries, as the webapp sends them to `search_reports`."""
+    rng = random.Random(seed)
+    return [rng.sample(DRUGS, rng.randint(1, 3)) for _ in range(n)]
+
+def latency_summary(times):
+    times = sorted(times)
+    return f'median {1000 * statistics.median(times):7.2f}ms   p95 {1000 * times[int(0.95 * (len(times) - 1))]:7.2f}ms'
+
+def bench_knn(queries, top_k=TOP_K, num_candidates=(KNN_NUM_CANDIDATES,), store=None, nprobe=(IVF_NPROBE,)):
+    """
+    Compares exact and approximate search on the local ES index (or the local vector store).
+
+    Query embeddings are computed up front, so only the search itself is timed. Recall@k is
+    the share of the exact top-k that the approximate search also returned. ElasticSearch is
+    swept over `num_candidates`; the local store over IVF `nprobe` (if an IVF has been built).
+    """
+    from search.embeddings import encode
+    from search.vector_store import get_store
+
+    vector_store = get_store(store)
+    embeddings = encode([f"Reports involving: {', '.join(q)}" for q in queries])
+
+    exact, times = [], []
+    for embedding in embeddings:
+        start = time.perf_counter()
+        exact.append({hit['reportid'] for hit in vector_store.search(embedding, top_k, exact=True)})
+        times.append(time.perf_counter() - start)
+    print(f'{f"{vector_store.name} exact":<32} {latency_summary(times)}   recall@{top_k} 1.000')
+
+    if vector_store.name == 'local':
+        settings = [(f'local ivf (nprobe={n})', {'nprobe': n}) for n in nprobe]
+    else:
+        settings = [(f'knn (num_candidates={n})', {'num_candidates': n}) for n in num_candidates]
+    for name, kwargs in settings:
+        recalls, times = [], []
+        for embedding, expected in zip(embeddings, exact):
+            start = time.perf_counter()
+            found = {hit['reportid'] for hit in vector_store.search(embedding, top_k, exact=False, **kwargs)}
+            times.append(time.perf_counter() - start)
+            recalls.append(len(found & expected) / len(expected) if expected else 1.0)
+        print(f'{name:<32} {latency_summary(times)}   recall@{top_k} {statistics.mean(recalls):.3f}')
+
+def bench_enrichment(queries, top_k=TOP_K):
+    """
+    Times enriching `queries` result lists of `top_k` random reports: per report (two helpers,
+    a pooled connection each, as `execute_query` used to) vs one batch `get_report_details` call.
+    """
+    from postgres.auth import Auth
+    from search.search_functions import get_reactions_and_seriousness, get_characterizations, get_report_details
+
+    conn = Auth.get_db_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT reportid FROM openfda.reports ORDER BY random() LIMIT %s", (queries * top_k,))
+    reportids = [row[0] for row in cur.fetchall()]
+    cur.close()
+    conn.close()
+    pages = [reportids[i:i + top_k] for i in range(0, len(reportids), top_k)]
+
+    legacy, times_legacy = [], []
+    for page in pages:
+        start = time.perf_counter()
+        legacy.append({rid: (*get_reactions_and_seriousness(rid), get_characterizations(rid)) for rid in page})
+        times_legacy.append(time.perf_counter() - start)
+
+    batch, times_batch = [], []
+    for page in pages:
+        start = time.perf_counter()
+        batch.append(get_report_details(page))
+        times_batch.append(time.perf_counter() - start)
+
+    for expected, actual in zip(legacy, batch):
+        for rid, (serious, reactions, chars) in expected.items():
+            assert actual[rid]["serious"] == serious
+            assert sorted(actual[rid]["reactions"]) == sorted(reactions)
+            assert actual[rid]["characterizations"] == chars
+    print(f'{"per report (N+1)":<32} {latency_summary(times_legacy)}')
+    print(f'{"batched (= ANY)":<32} {latency_summary(times_batch)}')
+
+def bench_resolve(queries):
+    """
+    Times resolving the drug names of `queries` queries to drugids: rebuilding the full mapping
+    per query (as `execute_query` used to) vs the long-lived `NameResolver`, checking both agree.
+    """
+    from search.name_resolver import NameResolver
+    from search.search_functions import get_drugid_name_mapping
+
+    names = make_queries(queries)
+
+    legacy, times_legacy = [], []
+    for query in names:
+        start = time.perf_counter()
+        mapping = get_drugid_name_mapping()
+        legacy.append({mapping[name.lower()] for name in query if name.lower() in mapping})
+        times_legacy.append(time.perf_counter() - start)
+
+    resolver = NameResolver()
+    start = time.perf_counter()
+    resolver.refresh()
+    print(f'{"resolver initial load":<32} {1000 * (time.perf_counter() - start):7.2f}ms   {len(resolver)} names')
+
+    times_resolver = []
+    for query, expected in zip(names, legacy):
+        start = time.perf_counter()
+        found = resolver.resolve_many(query)
+        times_resolver.append(time.perf_counter() - start)
+        assert expected <= found
+    print(f'{"full mapping per query":<32} {latency_summary(times_legacy)}')
+    print(f'{"resolver":<32} {latency_summary(times_resolver)}')
+
+def bench_async(queries, threads=8):
+    """
+    Serves `queries` drug-combination queries from `threads` threads (like one threaded webapp
+    worker): the blocking `execute_query` vs the `AsyncSearch` path.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from search.async_search import AsyncSearch
+    from search.search import execute_query
+
+    names = [[name.lower() for name in query] for query in make_queries(queries)]
+    async_search = AsyncSearch()
+
+    def run(name, fn):
+        def query(drugnames):
+            start = time.perf_counter()
+            fn(drugnames)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            times = list(executor.map(query, names))
+        elapsed = time.perf_counter() - start
+        print(f'{name:<32} {latency_summary(times)}   {queries / elapsed:9.1f} requests/sec')
+
+    run('blocking execute_query', execute_query)
+    run('async search', lambda drugnames: async_search.run(async_search.execute_query(drugnames)))
+    async_search.close()
+
+def bench_server(texts, threads, path):
+    """
+    Encodes `texts` one per request from `threads` threads: each on this process's model
+    (as every web worker used to) vs through the embedding server on `path`, which batches
+    concurrent requests. Both bypass the embedding cache on this side.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from search.embeddings import encode
+    from search.embedding_server import EmbeddingClient
+
+    client = EmbeddingClient(path)
+    before = client.stats()
+
+    def run(name, fn):
+        def request(text):
+            start = time.perf_counter()
+            fn(text)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            times = list(executor.map(request, texts))
+        elapsed = time.perf_counter() - start
+        print(f'{name:<32} {latency_summary(times)}   {len(texts) / elapsed:9.1f} queries/sec')
+
+    run('in-process, batch size 1', lambda text: encode([text], cache=False))
+    run('embedding server', client.encode_one)
+
+    after = client.stats()
+    batches = after['batches'] - before['batches']
+    print(f'{"  server":<32} {batches} batches, {(after["texts"] - before["texts"]) / max(batches, 1):.1f} texts per batch'
+          f' (window {after["window_ms"]:g}ms, max {after["max_batch"]})')
+
+def bench_pool(queries, threads=8):
+    """
+    Runs `queries` trivial queries from `threads` threads, opening a fresh connection per
+    query (as every call site used to) vs checking one out of the shared pool.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from postgres.auth import Auth
+    from postgres.pool import ConnectionPool
+
+    def run(name, get_conn):
+        def query(_):
+            start = time.perf_counter()
+            conn = get_conn()
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            conn.close()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            times = list(executor.map(query, range(queries)))
+        elapsed = time.perf_counter() - start
+        print(f'{name:<32} {latency_summary(times)}   {queries / elapsed:9.1f} queries/sec')
+
+    pool = ConnectionPool()
+    run('fresh connection per query', Auth.get_db_conn)
+    run(f'pooled (max_size={pool.max_size})', pool.getconn)
+    stats = pool.stats()
+    print(f'{"  pool":<32} {stats["created"]} connections   {stats["waits"]} waits   max wait {1000 * stats["max_wait_time"]:.2f}ms')
+    pool.closeall()
+
+# entry points that should import quickly; the heavy dependencies load on first use instead
+IMPORT_MODULES = ['search.search', 'search.async_search', 'search.batch.batch_index', 'webapp']
+HEAVY_MODULES = {'torch', 'transformers', 'sentence_transformers', 'elasticsearch', 'asyncpg', 'aiohttp'}
+
+def import_times(module):
+    """`python -X importtime -c "import module"` -> (total ms, {top-level package: cumulative ms}), or None if the import fails."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True)
+    if proc.returncode:
+        print(proc.stderr.strip().splitlines()[-1])
+        return None
+    total, packages = 0, {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if name.startswith('  '):
+            continue   # nested import, already counted in its parent's cumulative time
+        name = name.strip()
+        total += int(cumulative)
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + int(cumulative) / 1000
+    return total / 1000, packages
+
+def bench_importtime(modules=IMPORT_MODULES, budget_ms=IMPORT_BUDGET_MS):
+    """Reports the import time of `modules`. Returns False if one imports a heavy dependency or exceeds `budget_ms`."""
+    ok = True
+    for module in modules:
+        times = import_times(module)
+        if times is None:
+            print(f'{module}: import failed')
+            ok = False
+            continue
+        total, packages = times
+        heavy = sorted(HEAVY_MODULES & packages.keys())
+        slowest = ', '.join(f'{package} {ms:.0f}ms' for package, ms in sorted(packages.items(), key=lambda p: -p[1])[:3])
+        print(f'{module:<28} {total:7.1f}ms   ({slowest})')
+        if heavy:
+            print(f'  imports {", ".join(heavy)} at startup')
+            ok = False
+        if total > budget_ms:
+            print(f'  over the {budget_ms}ms budget')
+            ok = False
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--records', type=int, default=10000, help="number of synthetic reports")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for the synthetic reports")
+    parser.add_argument('--batch_size', type=int, default=ENCODE_BATCH_SIZE, help="sentences per forward pass of the model")
+    parser.add_argument('--workers', type=int, default=0, help="also benchmarks N CPU encoder processes")
+    parser.add_argument('--knn', action="store_true", help="benchmarks exact vs approximate search on the vector store instead")
+    parser.add_argument('--store', type=str, default=None, help="vector store for --knn (default: VECTOR_STORE)")
+    parser.add_argument('--enrich', action="store_true", help="benchmarks per-report vs batched metadata enrichment in postgres instead")
+    parser.add_argument('--resolve', action="store_true", help="benchmarks per-query vs cached drug name resolution instead")
+    parser.add_argument('--async_search', action="store_true", help="benchmarks blocking vs async query serving instead")
+    parser.add_argument('--server', type=str, default=None, help="benchmarks in-process vs embedding-server query encoding on this socket instead")
+    parser.add_argument('--pool', action="store_true", help="benchmarks fresh vs pooled postgres connections instead")
+    parser.add_argument('--onnx', action="store_true", help="benchmarks the torch vs ONNX (int8) backends and checks their parity instead (exits 1 below it)")
+    parser.add_argument('--importtime', action="store_true", help="checks the import time of the entry points instead (exits 1 on a regression)")
+    parser.add_argument('--budget_ms', type=float, default=IMPORT_BUDGET_MS, help="import time budget per entry point for --importtime")
+    parser.add_argument('--threads', type=int, default=8, help="concurrent clients for --async_search/--server/--pool")
+    parser.add_argument('--queries', type=int, default=100, help="number of queries for --onnx/--knn/--enrich/--resolve/--async_search/--server/--pool")
+    parser.add_argument('--top_k', type=int, default=TOP_K, help="results per query for --onnx/--knn/--enrich")
+    parser.add_argument('--num_candidates', type=int, nargs='+', default=[10, 50, KNN_NUM_CANDIDATES, 500], help="kNN num_candidates values to compare")
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, IVF_NPROBE, 32], help="IVF nprobe values to compare (local store)")
+
+    args = parser.parse_args()
+
+    if args.onnx:
+        texts = [create_synthetic_text(report) for report in make_reports(args.records, args.seed)]
+        print(f'{args.records} synthetic reports, {args.queries} queries, top {args.top_k}')
+        sys.exit(0 if bench_onnx(texts, make_queries(args.queries, args.seed), args.batch_size, args.top_k) else 1)
+
+    if args.importtime:
+        sys.exit(0 if bench_importtime(budget_ms=args.budget_ms) else 1)
+
+    if args.resolve:
+        print(f'{args.queries} queries')
+        bench_resolve(args.queries)
+        return
+
+    if args.async_search:
+        print(f'{args.queries} queries from {args.threads} threads')
+        bench_async(args.queries, args.threads)
+        return
+
+    if args.server:
+        texts = [create_synthetic_text(report) for report in make_reports(args.queries, args.seed)]
+        print(f'{args.queries} queries from {args.threads} threads')
+        bench_server(texts, args.threads, args.server)
+        return
+
+    if args.pool:
+        print(f'{args.queries} queries from {args.threads} threads')
+        bench_pool(args.queries, args.threads)
+        return
+
+    if args.enrich:
+        print(f'{args.queries} result lists of {args.top_k} reports')
+        bench_enrichment(args.queries, args.top_k)
+        return
+
+    if args.knn:
+        print(f'{args.queries} queries, top {args.top_k}')
+        bench_knn(make_queries(args.queries, args.seed), args.top_k, args.num_candidates, args.store, args.nprobe)
+        return
+
+    texts = [create_synthetic_text(report) for report in make_reports(args.records, args.seed)]
+    print(f'{args.records} synthetic reports')
+    bench_encoding(texts, args.batch_size, args.workers)
+    bench_cache(texts, args.batch_size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# ELASTICSEARCH
+ES_URL = "http://localhost:9200"
+INDEX_NAME = "reports_embeddings"
+META_INDEX_NAME = "reports_embeddings_meta"   # indexing high-water mark
+
+# EMBEDDING MODEL
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DIMS = 384
+MODEL_BACKEND = "torch"            # "torch", or "onnx" for ONNX Runtime inference (needs optimum[onnxruntime])
+ONNX_QUANTIZATION = "avx2"         # int8 ONNX model for this CPU ("arm64", "avx2", "avx512", "avx512_vnni"); None for float32
+ONNX_MODEL_DIR = "search/onnx"     # where the quantized model is exported on first use
+ONNX_MIN_COSINE = 0.99             # parity with torch required by `benchmark.py --onnx`: mean cosine similarity
+ONNX_MIN_TOPK_OVERLAP = 0.9        # ... and mean top-k overlap of search results
+
+# QUERYING
+TOP_K = 20
+KNN_NUM_CANDIDATES = 100   # HNSW candidates per shard; higher is slower but closer to exact
+EXACT_SEARCH = False       # brute-force script_score instead of approximate kNN
+NAME_REFRESH_INTERVAL = 60 # seconds between checks for newly ingested drug names
+
+# ASYNC SEARCH (async_search.py)
+ASYNC_PG_POOL_SIZE = 10    # asyncpg connections shared by all in-flight queries
+ENCODE_THREADS = 2         # threads running query encoding off the event loop
+
+# VECTOR STORE
+VECTOR_STORE = "elasticsearch"     # "elasticsearch", or "local" for the in-process index
+LOCAL_STORE_DIR = "search/vectors"
+LOCAL_STORE_QUANTIZE = False       # store int8 instead of float32 vectors
+IVF_NLIST = 0                      # k-means partitions built after indexing (0: always search every vector)
+IVF_NPROBE = 8                     # partitions searched per query
+
+# EMBEDDING SERVER (embedding_server.py)
+EMBEDDING_SERVER_SOCKET = None     # UNIX socket of a running server, e.g. "/tmp/openfda-embeddings.sock"; None encodes queries in-process
+EMBED_BATCH_WINDOW_MS = 5          # how long a batch waits for more queries; higher batches more but adds latency
+EMBED_MAX_BATCH = 64               # queries per batch at most
+
+# EMBEDDING CACHE
+EMBEDDING_CACHE_DIR = "search/cache"
+EMBEDDING_CACHE_SIZE = 250000   # cached vectors (float32, ~1.5KB each); 0 disables the cache
+
+# BATCH INDEXING
+INDEX_LIMIT_DEFAULT = 1000
+REPORT_BATCH_SIZE = 1024    # reports embedded (and sent to ES) per batch
+ENCODE_BATCH_SIZE = 64      # sentences per forward pass of the model
+ENCODE_WORKERS = 0          # CPU encoder processes (0 encodes in this process)
+BULK_CHUNK_SIZE = 500       # documents per bulk request
+BULK_THREADS = 4            # concurrent bulk requests
+
+# STARTUP
+IMPORT_BUDGET_MS = 500      # import time per entry point checked by `benchmark.py --importtime`
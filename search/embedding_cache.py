@@ -0,0 +1,132 @@
+# disk-backed embedding cache shared by the batch indexer and the query path
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from search.config import EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_SIZE, EMBEDDING_DIMS, MODEL_NAME
+
+class EmbeddingCache:
+    """
+    Bounded cache of embeddings keyed by text hash (see `embeddings.text_hash`).
+
+    Vectors live in a memory-mapped float32 matrix (`vectors.npy`, `capacity` x `dims`), and
+    an sqlite index (`index.db`) maps each hash to its row and last use. When the matrix is
+    full, the least recently used rows are reused. sqlite handles locking, so the indexer and
+    the webapp can share one cache directory.
+
+    `hits` and `misses` count lookups made through this instance.
+    """
+    def __init__(self, path=EMBEDDING_CACHE_DIR, capacity=EMBEDDING_CACHE_SIZE, dims=EMBEDDING_DIMS):
+        self.path = path
+        self.capacity = capacity
+        self.dims = dims
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        self.db = sqlite3.connect(os.path.join(path, 'index.db'), timeout=30, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS entries (hash TEXT PRIMARY KEY, row INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+
+        vectors_path = os.path.join(path, 'vectors.npy')
+        layout = f'{MODEL_NAME} {capacity}x{dims}'
+        stored = self.db.execute("SELECT value FROM meta WHERE key = 'layout'").fetchone()
+        if stored is None or stored[0] != layout or not os.path.exists(vectors_path):
+            # new cache, or one built for another model or shape: start over
+            self.db.execute("DELETE FROM entries")
+            self.vectors = np.lib.format.open_memmap(vectors_path, mode='w+', dtype=np.float32, shape=(capacity, dims))
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('layout', ?)", (layout,))
+        else:
+            self.vectors = np.load(vectors_path, mmap_mode='r+')
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def get_many(self, keys):
+        """Returns hash -> vector (a copy) for the given hashes that are cached, and marks them used."""
+        keys = list(dict.fromkeys(keys))
+        with self.lock:
+            # the write lock keeps put_many in another process from reusing a row between lookup and copy
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                found = self._rows(keys)
+                now = time.time()
+                self.db.executemany("UPDATE entries SET last_used = ? WHERE hash = ?", [(now, key) for key in found])
+                vectors = {key: np.array(self.vectors[row]) for key, row in found.items()}
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        self.hits += len(vectors)
+        self.misses += len(keys) - len(vectors)
+        return vectors
+
+    def put_many(self, keys, vectors):
+        """Caches `vectors[i]` under `keys[i]`, evicting the least recently used entries if full."""
+        entries = dict(zip(keys, vectors))
+        if self.capacity <= 0 or not entries:
+            return
+        # only the last `capacity` entries could be kept anyway
+        entries = dict(list(entries.items())[-self.capacity:])
+
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                existing = self._rows(entries)
+                self.db.executemany("UPDATE entries SET last_used = ? WHERE hash = ?", [(now, key) for key in existing])
+                new = [key for key in entries if key not in existing]
+
+                # rows are handed out in order until the matrix is full, then reused oldest first
+                used = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                rows = list(range(used, min(used + len(new), self.capacity)))
+                if len(rows) < len(new):
+                    evicted = self.db.execute(
+                        "SELECT hash, row FROM entries ORDER BY last_used LIMIT ?", (len(new) - len(rows),)
+                    ).fetchall()
+                    self.db.executemany("DELETE FROM entries WHERE hash = ?", [(key,) for key, _ in evicted])
+                    rows.extend(row for _, row in evicted)
+
+                # vectors are written before the index points at them
+                assigned = dict(zip(new, rows))
+                for key, row in assigned.items():
+                    self.vectors[row] = entries[key]
+                self.vectors.flush()
+
+                self.db.executemany("INSERT INTO entries VALUES (?, ?, ?)", [(key, row, now) for key, row in assigned.items()])
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def _rows(self, keys):
+        """Returns hash -> row for the given hashes that are cached."""
+        keys = list(keys)
+        found = {}
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            found.update(self.db.execute(
+                f"SELECT hash, row FROM entries WHERE hash IN ({', '.join('?' * len(part))})", part
+            ).fetchall())
+        return found
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self),
+            'capacity': self.capacity,
+        }
+
+    def close(self):
+        self.vectors.flush()
+        self.db.close()
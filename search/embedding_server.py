@@ -0,0 +1,218 @@
+# local embedding service: one model instance for every web worker, encoding concurrent queries in micro-batches
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+
+from search.config import EMBEDDING_SERVER_SOCKET, EMBEDDING_DIMS, EMBED_BATCH_WINDOW_MS, EMBED_MAX_BATCH
+
+# Messages are length-prefixed frames. A request is one JSON frame, {"texts": [...]} or
+# {"stats": true}. A reply is a JSON header frame ({"n": rows, "dims": dims}, or {"error": ...},
+# or the stats), followed for texts by one frame of n x dims float32 values.
+
+def send_frame(sock, payload):
+    sock.sendall(struct.pack('!I', len(payload)) + payload)
+
+def recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("embedding server connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def recv_frame(sock):
+    size, = struct.unpack('!I', recv_exact(sock, 4))
+    return recv_exact(sock, size)
+
+class Batcher:
+    """
+    Collects texts from concurrent requests and encodes them together.
+
+    A batch starts with the first waiting request and takes in every request that arrives
+    within `window_ms` milliseconds, up to `max_batch` texts, so single-query requests share
+    one forward pass instead of each paying for its own.
+    """
+    def __init__(self, window_ms=EMBED_BATCH_WINDOW_MS, max_batch=EMBED_MAX_BATCH):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'texts': 0, 'batches': 0, 'encode_time': 0.0, 'queue_time': 0.0}
+        threading.Thread(target=self._run, name='embedding-batcher', daemon=True).start()
+
+    def encode(self, texts):
+        """Queues `texts` for the next batch and waits for their embeddings."""
+        request = {'texts': texts, 'queued': time.perf_counter(), 'done': threading.Event()}
+        self.requests.put(request)
+        request['done'].wait()
+        if 'error' in request:
+            raise request['error']
+        return request['vectors']
+
+    def _run(self):
+        from search.embeddings import encode
+
+        while True:
+            batch = [self.requests.get()]
+            size = len(batch[0]['texts'])
+            deadline = time.perf_counter() + self.window
+            while size < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request['texts'])
+
+            start = time.perf_counter()
+            texts = [text for request in batch for text in request['texts']]
+            try:
+                vectors = encode(texts)
+            except Exception as e:
+                for request in batch:
+                    request['error'] = e
+                    request['done'].set()
+                continue
+            elapsed = time.perf_counter() - start
+
+            offset = 0
+            for request in batch:
+                n = len(request['texts'])
+                request['vectors'] = vectors[offset:offset + n]
+                offset += n
+                request['done'].set()
+
+            with self.lock:
+                self.counters['requests'] += len(batch)
+                self.counters['texts'] += len(texts)
+                self.counters['batches'] += 1
+                self.counters['encode_time'] += elapsed
+                self.counters['queue_time'] += sum(start - request['queued'] for request in batch)
+
+    def stats(self):
+        with self.lock:
+            batches, requests = self.counters['batches'], self.counters['requests']
+            return {
+                **self.counters,
+                'avg_batch_size': self.counters['texts'] / batches if batches else 0.0,
+                'avg_encode_time': self.counters['encode_time'] / batches if batches else 0.0,
+                'avg_queue_time': self.counters['queue_time'] / requests if requests else 0.0,
+                'window_ms': 1000 * self.window,
+                'max_batch': self.max_batch,
+            }
+
+class Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # a client keeps its connection open for any number of requests
+        while True:
+            try:
+                message = json.loads(recv_frame(self.request))
+            except (ConnectionError, OSError):
+                return
+            if message.get('stats'):
+                send_frame(self.request, json.dumps(self.server.batcher.stats()).encode('utf-8'))
+                continue
+            try:
+                vectors = np.ascontiguousarray(self.server.batcher.encode(message['texts']), dtype=np.float32)
+            except Exception as e:
+                send_frame(self.request, json.dumps({'error': repr(e)}).encode('utf-8'))
+                continue
+            send_frame(self.request, json.dumps({'n': vectors.shape[0], 'dims': vectors.shape[1]}).encode('utf-8'))
+            send_frame(self.request, vectors.tobytes())
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path=EMBEDDING_SERVER_SOCKET, window_ms=EMBED_BATCH_WINDOW_MS, max_batch=EMBED_MAX_BATCH):
+        if os.path.exists(path):
+            os.unlink(path)   # left over from a previous run
+        self.batcher = Batcher(window_ms, max_batch)
+        super().__init__(path, Handler)
+
+class EmbeddingClient:
+    """
+    Client for an EmbeddingServer on `path`. Thread-safe: each thread keeps its own
+    connection, opened on first use and reopened once if the server restarted.
+    """
+    def __init__(self, path=EMBEDDING_SERVER_SOCKET):
+        self.path = path
+        self.local = threading.local()
+
+    def _socket(self):
+        if getattr(self.local, 'sock', None) is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            self.local.sock = sock
+        return self.local.sock
+
+    def _request(self, message, retry=True):
+        try:
+            sock = self._socket()
+            send_frame(sock, json.dumps(message).encode('utf-8'))
+            header = json.loads(recv_frame(sock))
+            if 'n' in header:
+                data = recv_frame(sock)
+                return header, np.frombuffer(data, dtype=np.float32).reshape(header['n'], header['dims'])
+            return header, None
+        except (ConnectionError, OSError):
+            self.close()
+            if not retry:
+                raise
+            return self._request(message, retry=False)
+
+    def encode(self, texts):
+        """Embeds a list of texts on the server. Returns a (len(texts), dims) float32 array."""
+        if not texts:
+            return np.empty((0, EMBEDDING_DIMS), dtype=np.float32)
+        header, vectors = self._request({'texts': list(texts)})
+        if 'error' in header:
+            raise RuntimeError(f"embedding server: {header['error']}")
+        return vectors
+
+    def encode_one(self, text):
+        return self.encode([text])[0]
+
+    def stats(self):
+        return self._request({'stats': True})[0]
+
+    def close(self):
+        sock = getattr(self.local, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self.local.sock = None
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--socket', type=str, default=EMBEDDING_SERVER_SOCKET or '/tmp/openfda-embeddings.sock', help="UNIX socket to listen on")
+    parser.add_argument('--window_ms', type=float, default=EMBED_BATCH_WINDOW_MS, help="milliseconds a batch waits for more requests")
+    parser.add_argument('--max_batch', type=int, default=EMBED_MAX_BATCH, help="texts per batch at most")
+
+    args = parser.parse_args()
+
+    from search.embeddings import get_model
+    get_model()   # load before accepting requests
+
+    server = EmbeddingServer(args.socket, args.window_ms, args.max_batch)
+    print(f"Serving embeddings on {args.socket} (window {args.window_ms}ms, batches of up to {args.max_batch})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+if __name__ == "__main__":
+    main()
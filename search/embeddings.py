@@ -0,0 +1,125 @@
+# shared embedding entry point for the batch indexer and the query path
+import hashlib
+import os
+import threading
+import warnings
+
+import numpy as np
+
+from search.config import (
+    MODEL_NAME, EMBEDDING_DIMS, MODEL_BACKEND, ONNX_QUANTIZATION, ONNX_MODEL_DIR,
+    ENCODE_BATCH_SIZE, EMBEDDING_CACHE_SIZE, EMBEDDING_SERVER_SOCKET,
+)
+from search.embedding_cache import EmbeddingCache
+from search.embedding_server import EmbeddingClient
+
+_model = None
+_model_lock = threading.Lock()
+_cache = None
+_client = None
+
+def model_id(backend=MODEL_BACKEND, quantization=ONNX_QUANTIZATION):
+    """Identifies the model and inference backend, e.g. `sentence-transformers/all-MiniLM-L6-v2 onnx qint8_avx2`."""
+    if backend != 'onnx':
+        return MODEL_NAME
+    return f'{MODEL_NAME} onnx {f"qint8_{quantization}" if quantization else "fp32"}'
+
+def load_model(backend=MODEL_BACKEND, quantization=ONNX_QUANTIZATION, path=ONNX_MODEL_DIR):
+    """
+    Loads the SentenceTransformer for `backend`: PyTorch, or ONNX Runtime with an int8
+    model dynamically quantized for `quantization` (exported to `path` the first time).
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend != 'onnx':
+        return SentenceTransformer(MODEL_NAME)
+    if not quantization:
+        return SentenceTransformer(MODEL_NAME, backend='onnx')
+
+    file_name = f'onnx/model_qint8_{quantization}.onnx'
+    if not os.path.exists(os.path.join(path, file_name)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        model = SentenceTransformer(MODEL_NAME, backend='onnx')
+        model.save(path)   # tokenizer, pooling and the float32 model next to the quantized one
+        export_dynamic_quantized_onnx_model(model, quantization, path)
+    return SentenceTransformer(path, backend='onnx', model_kwargs={'file_name': file_name})
+
+def get_model():
+    """The SentenceTransformer, loaded on first use (processes that only query an embedding server never load it)."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = load_model()
+        return _model
+
+def get_cache():
+    """The process-wide EmbeddingCache, opened on first use. None if EMBEDDING_CACHE_SIZE is 0."""
+    global _cache
+    if _cache is None and EMBEDDING_CACHE_SIZE > 0:
+        _cache = EmbeddingCache()
+    return _cache
+
+MODEL_ID = model_id()   # the PyTorch backend keeps the plain model name, so existing hashes stay valid
+
+def text_hash(text):
+    """Content hash of a text. Includes the model and backend, so switching either re-embeds everything."""
+    return hashlib.sha256(f'{MODEL_ID}\n{text}'.encode('utf-8')).hexdigest()
+
+def start_encoders(workers):
+    """Starts `workers` CPU encoder processes for `encode`. Returns None (encode in-process) if `workers` is 0."""
+    if not workers:
+        return None
+    return get_model().start_multi_process_pool(target_devices=['cpu'] * workers)
+
+def stop_encoders(pool):
+    if pool is not None:
+        get_model().stop_multi_process_pool(pool)
+
+def encode(texts, batch_size=ENCODE_BATCH_SIZE, pool=None, cache=None):
+    """
+    Embeds a list of texts as a (len(texts), EMBEDDING_DIMS) float32 array.
+
+    Identical texts are embedded once, and texts already in the embedding cache are not
+    embedded at all. The rest are encoded in batches of `batch_size`, across the encoder
+    processes of `pool` if given, and added to the cache.
+
+    `cache` defaults to the shared cache (`get_cache()`); pass False to bypass it.
+    """
+    hashes = [text_hash(text) for text in texts]
+    if cache is None:
+        cache = get_cache()
+    elif cache is False:
+        cache = None
+    vectors = cache.get_many(hashes) if cache is not None else {}
+
+    missing = {h: text for h, text in zip(hashes, texts) if h not in vectors}
+    if missing:
+        if pool is not None:
+            encoded = get_model().encode_multi_process(list(missing.values()), pool, batch_size=batch_size)
+        else:
+            encoded = get_model().encode(list(missing.values()), batch_size=batch_size, convert_to_numpy=True)
+        encoded = encoded.astype(np.float32, copy=False)
+        vectors.update(zip(missing, encoded))
+        if cache is not None:
+            cache.put_many(list(missing), encoded)
+
+    if not texts:
+        return np.empty((0, EMBEDDING_DIMS), dtype=np.float32)
+    return np.stack([vectors[h] for h in hashes])
+
+def encode_one(text):
+    """
+    Embeds a single text (e.g. a query). Returns a float32 vector.
+
+    With EMBEDDING_SERVER_SOCKET set, the text is sent to the embedding server, which batches
+    it with other processes' queries. If the server is unreachable, it is encoded here instead.
+    """
+    global _client
+    if EMBEDDING_SERVER_SOCKET:
+        if _client is None:
+            _client = EmbeddingClient(EMBEDDING_SERVER_SOCKET)
+        try:
+            return _client.encode_one(text)
+        except (ConnectionError, OSError) as e:
+            warnings.warn(f"embedding server unavailable ({e}), encoding in-process")
+    return encode([text])[0]
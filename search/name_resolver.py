@@ -0,0 +1,130 @@
+# long-lived drug name -> drugid lookup for the query path
+import bisect
+import threading
+import time
+
+from postgres.pool import get_db_conn
+from search.config import NAME_REFRESH_INTERVAL
+
+def normalize(name):
+    return name.strip().lower()
+
+class NameResolver:
+    """
+    In-memory index of the brand and generic names in `openfda.drugs`.
+
+    Loaded once, then kept current from `drugs.ingested_at`: at most every `refresh_interval`
+    seconds, a lookup checks the newest and oldest `ingested_at` (two index probes) and reads
+    only the labels ingested since the last load. If the oldest one changed, the table was
+    rebuilt (e.g. `--init`), so everything is reloaded. On a schema without `ingested_at`,
+    every refresh reloads everything.
+
+    Names are matched case-insensitively. A name can belong to several labels, so lookups
+    return every matching drugid. `prefix()` walks a sorted list of the names with `bisect`.
+    """
+    def __init__(self, refresh_interval=NAME_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.drugids = {}      # normalized name -> set of drugids
+        self.display = {}      # normalized name -> name as first seen
+        self.names = []        # sorted normalized names
+        self.oldest = None     # min(ingested_at) at the last load
+        self.newest = None     # max(ingested_at) loaded so far
+        self.checked = 0.0     # time of the last refresh check
+
+    def __len__(self):
+        return len(self.drugids)
+
+    def refresh(self, force=False):
+        """Loads labels ingested since the last refresh (all of them the first time)."""
+        with self.lock:
+            if not force and time.monotonic() - self.checked < self.refresh_interval:
+                return
+            conn = get_db_conn()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT EXISTS (
+                        SELECT 1 FROM information_schema.columns
+                        WHERE table_schema = 'openfda' AND table_name = 'drugs' AND column_name = 'ingested_at'
+                    )
+                """)
+                if not cursor.fetchone()[0]:
+                    # a schema from before ingested_at (postgres/migrate.sql adds it): reload everything
+                    self.drugids, self.display, self.names, self.oldest, self.newest = {}, {}, [], None, None
+                    cursor.execute("SELECT drugid, brand_name, generic_name FROM openfda.drugs")
+                    self._add(cursor.fetchall())
+                else:
+                    cursor.execute("SELECT min(ingested_at), max(ingested_at) FROM openfda.drugs")
+                    oldest, newest = cursor.fetchone()
+
+                    if oldest != self.oldest or self.newest is None:
+                        # first load, or the table was rebuilt
+                        self.drugids, self.display, self.names, self.newest = {}, {}, [], None
+                        self.oldest = oldest
+                    if newest is not None and (self.newest is None or newest >= self.newest):
+                        # >= so labels sharing the newest timestamp are not missed; re-adding is harmless
+                        cursor.execute("""
+                            SELECT drugid, brand_name, generic_name FROM openfda.drugs
+                            WHERE ingested_at >= %s
+                        """, (self.newest or oldest,))
+                        self._add(cursor.fetchall())
+                        self.newest = newest
+                cursor.close()
+            finally:
+                conn.close()
+            self.checked = time.monotonic()
+
+    def _add(self, rows):
+        """Indexes (drugid, brand_name, generic_name) rows."""
+        new = []
+        for drugid, brand_names, generic_names in rows:
+            for name in (brand_names or []) + (generic_names or []):
+                if not name or not name.strip():
+                    continue
+                key = normalize(name)
+                if key not in self.drugids:
+                    self.drugids[key] = set()
+                    self.display[key] = name.strip()
+                    new.append(key)
+                self.drugids[key].add(str(drugid))
+        # a few new names are inserted in place, a large batch is cheaper to sort in
+        if len(new) > len(self.names) // 4:
+            self.names = sorted(self.drugids)
+        else:
+            for key in new:
+                bisect.insort(self.names, key)
+
+    def resolve(self, name):
+        """Returns the set of drugids named `name` (any case), empty if unknown."""
+        self.refresh()
+        with self.lock:
+            return set(self.drugids.get(normalize(name), ()))
+
+    def resolve_many(self, names):
+        """Returns the set of drugids named by any of `names`."""
+        self.refresh()
+        with self.lock:
+            return {drugid for name in names for drugid in self.drugids.get(normalize(name), ())}
+
+    def prefix(self, prefix, limit=10):
+        """Returns up to `limit` (name, sorted drugids) pairs whose name starts with `prefix`, in name order."""
+        self.refresh()
+        prefix = normalize(prefix)
+        matches = []
+        with self.lock:
+            names = self.names
+            for i in range(bisect.bisect_left(names, prefix), len(names)):
+                if len(matches) >= limit or not names[i].startswith(prefix):
+                    break
+                matches.append((self.display[names[i]], sorted(self.drugids[names[i]])))
+        return matches
+
+_resolver = None
+
+def get_resolver():
+    """The process-wide NameResolver, loaded on first use."""
+    global _resolver
+    if _resolver is None:
+        _resolver = NameResolver()
+    return _resolver
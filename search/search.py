@@ -1,24 +1,31 @@
-from search_functions import search_reports, get_characterizations, get_drugid_name_mapping, get_reactions_and_seriousness
+from collections import Counter
+
+from search.name_resolver import get_resolver
+from search.search_functions import search_reports, get_report_details
 
 def execute_query(drugnames):
     """Execute semantic query over ES, enrich with metadata and drug characterization info."""
 
     drugnames = [d.lower() for d in drugnames]
-    name_to_drugid = get_drugid_name_mapping()
-    target_drugids = {name_to_drugid[name] for name in drugnames if name in name_to_drugid}
+    target_drugids = get_resolver().resolve_many(drugnames)
 
     results = search_reports(drugnames)
-    
+    details = get_report_details([entry["reportid"] for entry in results])
+
+    return summarize(results, details, target_drugids)
+
+def summarize(results, details, target_drugids):
+    """Annotates search `results` with their `details` and aggregates them (shared with `async_search.py`)."""
     strong_reports = []
     all_reactions = []
 
     for entry in results:
-        reportid = entry["reportid"]
-        serious, reactions = get_reactions_and_seriousness(reportid)
-        char_map = get_characterizations(reportid)
+        report = details[int(entry["reportid"])]
+        serious, reactions = report["serious"], report["reactions"]
+        char_map = report["characterizations"]
 
         in_relevant = {drugid for drugid, char in char_map.items() if drugid in target_drugids and char == 1}
-        
+
         entry["serious"] = serious
         entry["reactions"] = reactions
         entry["char_match"] = len(in_relevant) > 0  # True if any queried drug is a likely cause
@@ -27,7 +34,31 @@ def execute_query(drugnames):
             all_reactions.extend(reactions)
             strong_reports.append(entry)
 
-    from collections import Counter
     top_reactions = dict(Counter(all_reactions).most_common(10))
 
-    return results, top_reactions, len(strong_reports), sum(r["serious"] for r in strong_reports)
\ No newline at end of file
+    return results, top_reactions, len(strong_reports), sum(bool(r["serious"]) for r in strong_reports)
+
+def warm_up(store=None):
+    """
+    Sets up, ahead of the first query, everything the query path otherwise creates on first
+    use: the model (or the embedding server connection), the embedding cache, the vector store
+    and its client, and the drug name index (which opens a pooled PSQL connection).
+
+    Returns:
+        step -> seconds taken
+    """
+    import time
+    from search.embeddings import get_cache, encode_one
+    from search.vector_store import get_store
+
+    timings = {}
+    def step(name, fn):
+        start = time.perf_counter()
+        fn()
+        timings[name] = time.perf_counter() - start
+
+    step('embedding cache', get_cache)
+    step('model', lambda: encode_one("Reports involving: warm up"))   # first inference is slow too
+    step('vector store', lambda: get_store(store).exists())
+    step('drug names', lambda: get_resolver().refresh(force=True))
+    return timings
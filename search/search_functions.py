@@ -1,45 +1,40 @@
-from elasticsearch import Elasticsearch
-from sentence_transformers import SentenceTransformer
-
-from postgres.auth import Auth
-
-es = Elasticsearch("http://localhost:9200")
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-
-def search_reports(drugnames, top_k=20):
+from postgres.pool import get_db_conn
+from search.config import TOP_K, KNN_NUM_CANDIDATES, EXACT_SEARCH
+from search.embeddings import encode_one
+from search.vector_store import get_store
+
+# shared with the async search path (async_search.py), hence one parameter each
+MED_INFO_SQL = """
+    SELECT d.boxed_warning, d.warnings_and_cautions, d.warnings
+    FROM openfda.medications m
+    JOIN openfda.drugs d ON d.drugid = m.drugid
+    WHERE lower(m.med_name) = %s
+    ORDER BY d.effective_time DESC NULLS LAST
+    LIMIT 1
+"""
+SERIOUS_SQL = """
+    SELECT reportid, serious FROM openfda.reports WHERE reportid = ANY(%s)
+"""
+REACTIONS_SQL = """
+    SELECT reportid, reactionmeddrapt FROM openfda.reactions
+    WHERE reportid = ANY(%s) AND reactionoutcome <> 6 AND reactionoutcome IS NOT NULL
+"""
+CHARACTERIZATIONS_SQL = """
+    SELECT reportid, drugid, characterization FROM openfda.drugreports WHERE reportid = ANY(%s)
+"""
+
+def search_reports(drugnames, top_k=TOP_K, exact=EXACT_SEARCH, num_candidates=KNN_NUM_CANDIDATES, filter=None, store=None):
     query_text = f"Reports involving: {', '.join(drugnames)}"
-    embedding = model.encode(query_text).tolist()
-
-    query_body = {
-        "size": top_k,
-        "query": {
-            "script_score": {
-                "query": {"match_all": {}},
-                "script": {
-                    "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
-                    "params": {"query_vector": embedding}
-                }
-            }
-        }
-    }
-
-    results = es.search(index="reports_embeddings", body=query_body)
-
-    # Parse out results
-    parsed = []
-    for hit in results["hits"]["hits"]:
-        source = hit["_source"]
-        parsed.append({
-            "reportid": source["reportid"],
-            "text": source["synthetic_text"],
-            "score": hit["_score"]
-        })
-
-    return parsed
+    embedding = encode_one(query_text)
+    return search_embedding(embedding, top_k, exact, num_candidates, filter, store)
+
+def search_embedding(embedding, top_k=TOP_K, exact=EXACT_SEARCH, num_candidates=KNN_NUM_CANDIDATES, filter=None, store=None):
+    """Finds the `top_k` reports closest to `embedding` in the vector store (VECTOR_STORE in config.py by default)."""
+    return get_store(store).search(embedding, top_k, exact=exact, num_candidates=num_candidates, filter=filter)
 
 def get_characterizations(reportid):
     """Get drugid + characterization for a report."""
-    conn = Auth.get_db_conn()
+    conn = get_db_conn()
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -57,11 +52,11 @@ def get_characterizations(reportid):
 
 def get_drugid_name_mapping():
     """Map all drug names to drugids."""
-    conn = Auth.get_db_conn()
+    conn = get_db_conn()
     cursor = conn.cursor()
 
     cursor.execute("""
-        SELECT drugid, name FROM openfda.medications
+        SELECT drugid, med_name FROM openfda.medications
     """)
     rows = cursor.fetchall()
 
@@ -71,12 +66,38 @@ def get_drugid_name_mapping():
     # name is lowercase string, drugid is int or str
     return {name.lower(): str(drugid) for drugid, name in rows}
 
+def get_med_info(drugname, conn=None):
+    """
+    Label warning for a drug name (any case): the boxed warning of its most recent label,
+    else its warnings and cautions, else its warnings. None if there is no such label or warning.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_conn()
+    cursor = conn.cursor()
+
+    cursor.execute(MED_INFO_SQL, (drugname.strip().lower(),))
+    row = cursor.fetchone()
+
+    cursor.close()
+    if own_conn:
+        conn.close()
+
+    return label_warning(row)
+
+def label_warning(row):
+    """The first non-empty warning of a MED_INFO_SQL row (None if no row)."""
+    for texts in row or ():
+        if texts and texts[0]:
+            return texts[0]
+    return None
+
 def get_reactions_and_seriousness(reportid):
-    conn = Auth.get_db_conn()
+    conn = get_db_conn()
     cursor = conn.cursor()
     
     cursor.execute("""
-        SELECT seriousness FROM openfda.reports WHERE reportid = %s
+        SELECT serious FROM openfda.reports WHERE reportid = %s
     """, (reportid,))
     serious = cursor.fetchone()[0]
 
@@ -89,4 +110,47 @@ def get_reactions_and_seriousness(reportid):
     cursor.close()
     conn.close()
 
-    return serious, reactions
\ No newline at end of file
+    return serious, reactions
+
+def get_report_details(reportids, conn=None):
+    """
+    Batch version of `get_reactions_and_seriousness` and `get_characterizations`.
+
+    Resolves a whole list of reports with one `reportid = ANY(%s)` query per table, over a
+    single connection (`conn` if given).
+
+    Returns:
+        reportid -> {"serious": bool, "reactions": [PT, ...], "characterizations": {drugid: characterization}}
+    """
+    reportids = [int(rid) for rid in reportids]
+    details = {rid: {"serious": None, "reactions": [], "characterizations": {}} for rid in reportids}
+    if not reportids:
+        return details
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_conn()
+    cursor = conn.cursor()
+
+    cursor.execute(SERIOUS_SQL, (reportids,))
+    serious = cursor.fetchall()
+    cursor.execute(REACTIONS_SQL, (reportids,))
+    reactions = cursor.fetchall()
+    cursor.execute(CHARACTERIZATIONS_SQL, (reportids,))
+    characterizations = cursor.fetchall()
+    fill_report_details(details, serious, reactions, characterizations)
+
+    cursor.close()
+    if own_conn:
+        conn.close()
+
+    return details
+
+def fill_report_details(details, serious, reactions, characterizations):
+    """Fills `details` (as built by `get_report_details`) from the rows of the three report queries."""
+    for reportid, is_serious in serious:
+        details[reportid]["serious"] = is_serious
+    for reportid, reaction in reactions:
+        details[reportid]["reactions"].append(reaction)
+    for reportid, drugid, char in characterizations:
+        details[reportid]["characterizations"][drugid] = char
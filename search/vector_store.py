@@ -0,0 +1,469 @@
+# pluggable vector stores for report embeddings: ElasticSearch, or a local in-process index
+import os
+import shutil
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+from search.config import ES_URL, INDEX_NAME, META_INDEX_NAME, EMBEDDING_DIMS, TOP_K, KNN_NUM_CANDIDATES, EXACT_SEARCH
+from search.config import BULK_CHUNK_SIZE, BULK_THREADS, VECTOR_STORE, LOCAL_STORE_DIR, LOCAL_STORE_QUANTIZE, IVF_NPROBE
+
+mapping = {
+    "mappings": {
+        "properties": {
+            "reportid": {"type": "keyword"},
+            "text": {"type": "text"},
+            "text_hash": {"type": "keyword"},
+            "embedding": {
+                "type": "dense_vector",
+                "dims": EMBEDDING_DIMS,
+                "index": True,
+                "similarity": "cosine"
+            }
+        }
+    }
+}
+
+class ElasticsearchStore:
+    """
+    Report embeddings in the `reports_embeddings` ElasticSearch index.
+
+    Documents (`reportid`, `text`, `text_hash`, `embedding`) are sent with the bulk helpers,
+    and the indexer's high-water mark is kept in META_INDEX_NAME.
+    """
+    name = 'elasticsearch'
+    mark_id = 'state'
+
+    def __init__(self, url=ES_URL, index=INDEX_NAME, meta_index=META_INDEX_NAME):
+        self.url = url
+        self.index_name = index
+        self.meta_index = meta_index
+
+    @property
+    def es(self):
+        return get_es(self.url)
+
+    def exists(self):
+        return self.es.indices.exists(index=self.index_name)
+
+    def reset(self):
+        """Recreates the index (and drops its high-water mark)."""
+        # Delete the index if it already exists
+        if self.es.indices.exists(index=self.index_name):
+            self.es.indices.delete(index=self.index_name)
+        if self.es.indices.exists(index=self.meta_index):
+            self.es.indices.delete(index=self.meta_index)
+
+        # Create the index
+        self.es.indices.create(index=self.index_name, body=mapping)
+        print(f"Created Elasticsearch index '{self.index_name}' for adverse event reports.")
+
+    def hashes(self, reportids):
+        """Returns reportid (as str) -> stored `text_hash` for the given reports that are indexed."""
+        docs = self.es.mget(index=self.index_name, ids=[str(rid) for rid in reportids], source_includes=['text_hash'])['docs']
+        return {doc['_id']: doc['_source'].get('text_hash') for doc in docs if doc.get('found')}
+
+    def load_mark(self):
+        if not self.es.indices.exists(index=self.meta_index):
+            return 0
+        doc = self.es.options(ignore_status=404).get(index=self.meta_index, id=self.mark_id)
+        return doc['_source']['last_reportid'] if doc.get('found') else 0
+
+    def save_mark(self, last_reportid):
+        self.es.index(index=self.meta_index, id=self.mark_id, body={
+            "last_reportid": last_reportid,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        })
+
+    def _actions(self, docs):
+        for doc in docs:
+            yield {
+                "_index": self.index_name,
+                "_id": doc["reportid"],
+                "_source": {**doc, "embedding": doc["embedding"].tolist()}
+            }
+
+    def index(self, docs, chunk_size=BULK_CHUNK_SIZE, threads=BULK_THREADS, checkpoint=None):
+        """
+        Sends documents to ElasticSearch in bulk requests of `chunk_size` documents.
+
+        Uses `parallel_bulk` with `threads` concurrent requests (`streaming_bulk` if `threads` is 1).
+        Both report results in document order, so `checkpoint` (if given) is advanced as batches complete.
+
+        Returns:
+            The number of documents indexed.
+        """
+        from elasticsearch import helpers
+
+        if threads > 1:
+            results = helpers.parallel_bulk(self.es, self._actions(docs), thread_count=threads, chunk_size=chunk_size)
+        else:
+            results = helpers.streaming_bulk(self.es, self._actions(docs), chunk_size=chunk_size)
+        indexed = 0
+        for ok, _ in results:
+            indexed += ok
+            if checkpoint is not None:
+                checkpoint.advance(indexed)
+        if checkpoint is not None:
+            checkpoint.advance(indexed)
+        return indexed
+
+    def search(self, embedding, top_k=TOP_K, exact=EXACT_SEARCH, num_candidates=KNN_NUM_CANDIDATES, filter=None):
+        """
+        Finds the `top_k` reports closest to `embedding`.
+
+        By default this is an approximate kNN search over the HNSW graph of the `embedding`
+        field, looking at `num_candidates` candidates per shard. With `exact`, every document
+        (matching `filter`) is scored with `cosineSimilarity` instead, which is slower but exact.
+        `filter` is an optional ES query restricting which reports can be returned.
+        """
+        results = self.es.search(index=self.index_name, body=self.query_body(embedding, top_k, exact, num_candidates, filter))
+        return self.parse_hits(results)
+
+    def query_body(self, embedding, top_k=TOP_K, exact=EXACT_SEARCH, num_candidates=KNN_NUM_CANDIDATES, filter=None):
+        """The ES search request for `search` (shared with the async client in `async_search.py`)."""
+        embedding = [float(x) for x in embedding]
+        if exact:
+            query_body = {
+                "size": top_k,
+                "query": {
+                    "script_score": {
+                        "query": filter or {"match_all": {}},
+                        "script": {
+                            "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
+                            "params": {"query_vector": embedding}
+                        }
+                    }
+                }
+            }
+        else:
+            knn = {
+                "field": "embedding",
+                "query_vector": embedding,
+                "k": top_k,
+                "num_candidates": max(num_candidates, top_k)
+            }
+            if filter:
+                knn["filter"] = filter
+            query_body = {"size": top_k, "knn": knn}
+        query_body["_source"] = ["reportid", "text"]
+        return query_body
+
+    @staticmethod
+    def parse_hits(results):
+        """Parses out search results as {reportid, text, score} dicts."""
+        parsed = []
+        for hit in results["hits"]["hits"]:
+            source = hit["_source"]
+            parsed.append({
+                "reportid": source["reportid"],
+                "text": source["text"],
+                "score": hit["_score"]
+            })
+
+        return parsed
+
+class LocalStore:
+    """
+    Report embeddings in a local directory, searched in-process with NumPy.
+
+    - `vectors.npy`: memory-mapped matrix of unit-normalized embeddings, float32, or int8 with
+      `quantize` (components scaled by 127, a quarter of the memory at a small cost in accuracy)
+    - `docs.db`: sqlite table of reportid -> row, text and text_hash, plus the row count and
+      the indexer's high-water mark
+
+    Search scores every row with one matrix-vector product (in blocks) and picks the top k
+    with `argpartition`. After `build_ivf(nlist)`, rows are also assigned to `nlist` k-means
+    partitions, and a search only scores the rows in the `nprobe` partitions nearest the query.
+    Rows added later are assigned to their nearest partition as they are added.
+
+    Scores are `(1 + cosine) / 2`, as in the ElasticSearch kNN search.
+    """
+    name = 'local'
+    block_size = 1 << 14
+
+    def __init__(self, path=LOCAL_STORE_DIR, quantize=LOCAL_STORE_QUANTIZE, dims=EMBEDDING_DIMS):
+        self.path = path
+        self.dims = dims
+        self.dtype = np.int8 if quantize else np.float32
+        self.lock = threading.Lock()
+        self.db = None
+        self._open()
+
+    def _open(self):
+        os.makedirs(self.path, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(self.path, 'docs.db'), timeout=30, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS docs (reportid INTEGER PRIMARY KEY, row INTEGER UNIQUE NOT NULL, text TEXT, text_hash TEXT)")
+        layout = f'{np.dtype(self.dtype).name} {self.dims}'
+        stored = self._meta('layout')
+        if stored is not None and stored != layout:
+            raise ValueError(f"{self.path} holds {stored} vectors, not {layout}; reset it or change LOCAL_STORE_QUANTIZE")
+        self._set_meta('layout', layout)
+        self.count = 0
+        self.vectors = None
+        self.assign = None
+        self.centroids = None
+        self._ivf_version = None
+        self._sync()
+
+    def _meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _sync(self):
+        """Picks up rows (and a rebuilt IVF) written by another process since the files were opened."""
+        # one statement, so capacity and count come from the same commit
+        meta = dict(self.db.execute("SELECT key, value FROM meta WHERE key IN ('capacity', 'count', 'ivf')").fetchall())
+        capacity = int(meta.get('capacity') or 0)
+        if capacity and (self.vectors is None or self.vectors.shape[0] != capacity):
+            # the files were reallocated by _grow
+            self.vectors = np.load(self._file('vectors.npy'), mmap_mode='r+')
+            if os.path.exists(self._file('assign.npy')):
+                self.assign = np.load(self._file('assign.npy'), mmap_mode='r+')
+        ivf = meta.get('ivf')
+        if ivf is not None and ivf != self._ivf_version:
+            self.centroids = np.load(self._file('centroids.npy'))
+            self.assign = np.load(self._file('assign.npy'), mmap_mode='r+')
+            self._ivf_version = ivf
+        # never past the rows mapped here, should the files have grown since
+        self.count = min(int(meta.get('count') or 0), self.vectors.shape[0] if self.vectors is not None else 0)
+
+    def exists(self):
+        return self.count > 0 or self._meta('mark') is not None
+
+    def reset(self):
+        """Deletes every stored vector and document."""
+        with self.lock:
+            self.db.close()
+            self.vectors = self.assign = None
+            shutil.rmtree(self.path, ignore_errors=True)
+            self._open()
+        print(f"Created local vector store in '{self.path}' for adverse event reports.")
+
+    def hashes(self, reportids):
+        """Returns reportid (as str) -> stored `text_hash` for the given reports that are indexed."""
+        reportids = [int(rid) for rid in reportids]
+        found = {}
+        for start in range(0, len(reportids), 500):
+            part = reportids[start:start + 500]
+            found.update((str(rid), h) for rid, h in self.db.execute(
+                f"SELECT reportid, text_hash FROM docs WHERE reportid IN ({', '.join('?' * len(part))})", part
+            ))
+        return found
+
+    def load_mark(self):
+        return int(self._meta('mark') or 0)
+
+    def save_mark(self, last_reportid):
+        self._set_meta('mark', last_reportid)
+
+    @staticmethod
+    def _normalize(embeddings):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+    def _encode(self, embeddings):
+        vectors = self._normalize(embeddings)
+        if self.dtype == np.int8:
+            return np.clip(np.rint(vectors * 127), -127, 127).astype(np.int8)
+        return vectors
+
+    def _decode(self, vectors):
+        if self.dtype == np.int8:
+            return vectors.astype(np.float32) / 127
+        return vectors
+
+    def _grow(self, needed):
+        """Reallocates the memory-mapped files (doubling) so they hold at least `needed` rows."""
+        capacity = self.vectors.shape[0] if self.vectors is not None else 0
+        if needed <= capacity:
+            return
+        capacity = max(needed, 2 * capacity, 1024)
+        for name, shape, dtype, old in (('vectors.npy', (capacity, self.dims), self.dtype, self.vectors),
+                                        ('assign.npy', (capacity,), np.int32, self.assign)):
+            if name == 'assign.npy' and old is None:
+                continue
+            tmp = self._file(name + '.tmp')
+            new = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=shape)
+            if old is not None:
+                new[:self.count] = old[:self.count]
+            new.flush()
+            del new
+            os.replace(tmp, self._file(name))
+        self.vectors = np.load(self._file('vectors.npy'), mmap_mode='r+')
+        if self.assign is not None:
+            self.assign = np.load(self._file('assign.npy'), mmap_mode='r+')
+        self._set_meta('capacity', capacity)
+
+    def _nearest_partition(self, vectors):
+        return np.argmax(self._decode(vectors) @ self.centroids.T, axis=1).astype(np.int32)
+
+    def add(self, docs):
+        """Adds (or replaces, by reportid) documents with `reportid`, `text`, `text_hash` and `embedding`."""
+        if not docs:
+            return 0
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self._sync()
+                docs = list({doc['reportid']: doc for doc in docs}.values())
+                reportids = [doc['reportid'] for doc in docs]
+                existing = {}
+                for start in range(0, len(reportids), 500):
+                    part = reportids[start:start + 500]
+                    existing.update(self.db.execute(
+                        f"SELECT reportid, row FROM docs WHERE reportid IN ({', '.join('?' * len(part))})", part
+                    ))
+                new = [rid for rid in reportids if rid not in existing]
+                rows = {**existing, **dict(zip(new, range(self.count, self.count + len(new))))}
+                self._grow(self.count + len(new))
+
+                # vectors are written before the documents point at them
+                index = np.array([rows[rid] for rid in reportids])
+                vectors = self._encode([doc['embedding'] for doc in docs])
+                self.vectors[index] = vectors
+                self.vectors.flush()
+                if self.centroids is not None:
+                    self.assign[index] = self._nearest_partition(vectors)
+                    self.assign.flush()
+
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?)",
+                    [(doc['reportid'], rows[doc['reportid']], doc['text'], doc['text_hash']) for doc in docs]
+                )
+                self.count += len(new)
+                self._set_meta('count', self.count)
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        return len(docs)
+
+    def index(self, docs, chunk_size=BULK_CHUNK_SIZE, threads=None, checkpoint=None):
+        """Adds documents `chunk_size` at a time, advancing `checkpoint` (if given) after each chunk."""
+        indexed = 0
+        chunk = []
+        for doc in docs:
+            chunk.append(doc)
+            if len(chunk) == chunk_size:
+                indexed += self.add(chunk)
+                chunk = []
+                if checkpoint is not None:
+                    checkpoint.advance(indexed)
+        indexed += self.add(chunk)
+        if checkpoint is not None:
+            checkpoint.advance(indexed)
+        return indexed
+
+    def build_ivf(self, nlist, iterations=10, sample=100000, seed=0):
+        """Trains `nlist` spherical k-means partitions on a sample of the stored vectors and assigns every row."""
+        with self.lock:
+            self._sync()
+            rng = np.random.default_rng(seed)
+            n = self.count
+            nlist = min(nlist, n)
+            if nlist == 0:
+                return
+            train = self._decode(self.vectors[np.sort(rng.choice(n, min(sample, n), replace=False))])
+            centroids = train[rng.choice(len(train), nlist, replace=False)]
+            for _ in range(iterations):
+                labels = np.argmax(train @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, train)
+                empty = ~np.bincount(labels, minlength=nlist).astype(bool)
+                sums[empty] = centroids[empty]
+                centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+            assign = np.lib.format.open_memmap(self._file('assign.npy.tmp'), mode='w+', dtype=np.int32, shape=(self.vectors.shape[0],))
+            self.centroids = centroids.astype(np.float32)
+            for start in range(0, n, self.block_size):
+                end = min(start + self.block_size, n)
+                assign[start:end] = self._nearest_partition(self.vectors[start:end])
+            assign.flush()
+            del assign
+            np.save(self._file('centroids.npy'), self.centroids)
+            os.replace(self._file('assign.npy.tmp'), self._file('assign.npy'))
+            self.assign = np.load(self._file('assign.npy'), mmap_mode='r+')
+            self._ivf_version = datetime.now(timezone.utc).isoformat()
+            self._set_meta('ivf', self._ivf_version)
+
+    def _scores(self, query, rows=None):
+        """Cosine similarity of `query` with every row (or the given rows), computed in blocks."""
+        n = self.count if rows is None else len(rows)
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, self.block_size):
+            end = min(start + self.block_size, n)
+            block = self.vectors[start:end] if rows is None else self.vectors[rows[start:end]]
+            scores[start:end] = self._decode(block) @ query
+        return scores
+
+    def search(self, embedding, top_k=TOP_K, exact=EXACT_SEARCH, num_candidates=None, filter=None, nprobe=IVF_NPROBE):
+        """
+        Finds the `top_k` reports closest to `embedding`.
+
+        Searches only the `nprobe` nearest IVF partitions if an IVF has been built, unless
+        `exact`. `num_candidates` is accepted for compatibility and ignored; filters are not supported.
+        """
+        if filter:
+            raise ValueError("LocalStore does not support filters")
+        with self.lock:
+            self._sync()
+            if self.count == 0:
+                return []
+            query = self._normalize(embedding)
+            rows = None
+            if not exact and self.centroids is not None and nprobe < len(self.centroids):
+                probes = np.argpartition(-(self.centroids @ query), nprobe)[:nprobe]
+                rows = np.flatnonzero(np.isin(self.assign[:self.count], probes))
+            scores = self._scores(query, rows)
+
+            k = min(top_k, len(scores))
+            if k == 0:
+                return []
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            best_rows = best if rows is None else rows[best]
+
+            docs = dict((row, (rid, text)) for rid, row, text in self.db.execute(
+                f"SELECT reportid, row, text FROM docs WHERE row IN ({', '.join('?' * k)})", [int(r) for r in best_rows]
+            ))
+        return [
+            {"reportid": docs[int(row)][0], "text": docs[int(row)][1], "score": float((1 + score) / 2)}
+            for row, score in zip(best_rows, scores[best])
+        ]
+
+    def close(self):
+        self.db.close()
+
+STORES = {store.name: store for store in (ElasticsearchStore, LocalStore)}
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_es(url=ES_URL):
+    """The process-wide ElasticSearch client for `url`, created on first use (the client library alone takes a while to import)."""
+    with _clients_lock:
+        if url not in _clients:
+            from elasticsearch import Elasticsearch
+            _clients[url] = Elasticsearch(url)
+        return _clients[url]
+
+_stores = {}
+
+def get_store(name=None):
+    """The process-wide vector store named `name` (default: VECTOR_STORE in config.py), created on first use."""
+    name = name or VECTOR_STORE
+    if name not in _stores:
+        if name not in STORES:
+            raise ValueError(f"unknown vector store '{name}' (expected one of {', '.join(STORES)})")
+        _stores[name] = STORES[name]()
+    return _stores[name]
@@ -4,4 +4,10 @@ app = Flask(__name__)
 
 # Import views_bp after app is created to avoid circular import
 from webapp.views import views_bp
-app.register_blueprint(views_bp)
\ No newline at end of file
+app.register_blueprint(views_bp)
+
+# models and clients are otherwise created by the first request that needs them
+from webapp.config import Config
+if Config.WARM_UP:
+    from search.search import warm_up
+    warm_up()
@@ -0,0 +1,71 @@
+# latency of /autocomplete under concurrent typing, against a running webapp
+import argparse
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+NAMES = ['acetaminophen', 'adalimumab', 'amlodipine', 'amoxicillin', 'aspirin', 'atorvastatin', 'gabapentin',
+         'humira', 'ibuprofen', 'lipitor', 'lisinopril', 'metformin', 'omeprazole', 'prednisone', 'sertraline', 'warfarin']
+
+_sessions = threading.local()
+
+def session():
+    """One keep-alive HTTP session per thread."""
+    if not hasattr(_sessions, 'session'):
+        _sessions.session = requests.Session()
+    return _sessions.session
+
+def type_name(url, name, max_chars, delay):
+    """Requests suggestions for every prefix of `name`, as a user typing it would. Returns (prefix length, seconds) pairs."""
+    times = []
+    for n in range(1, min(len(name), max_chars) + 1):
+        start = time.perf_counter()
+        response = session().get(f'{url}/autocomplete', params={'q': name[:n]})
+        if response.status_code not in (200, 404):
+            response.raise_for_status()
+        times.append((n, time.perf_counter() - start))
+        time.sleep(delay)
+    return times
+
+def percentile(times, p):
+    times = sorted(times)
+    return times[int(p * (len(times) - 1))]
+
+def summary(times):
+    return (f'median {1000 * statistics.median(times):7.2f}ms   p95 {1000 * percentile(times, 0.95):7.2f}ms'
+            f'   p99 {1000 * percentile(times, 0.99):7.2f}ms')
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--url', type=str, default='http://localhost:5000', help="webapp base URL")
+    parser.add_argument('--users', type=int, default=200, help="number of simulated users, each typing one name")
+    parser.add_argument('--threads', type=int, default=16, help="users typing at the same time")
+    parser.add_argument('--max_chars', type=int, default=8, help="characters typed per name")
+    parser.add_argument('--delay', type=float, default=0.05, help="seconds between keystrokes")
+    parser.add_argument('--names', type=str, nargs='+', default=NAMES, help="names to type (sampled with replacement)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for the name sample")
+
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = [rng.choice(args.names) for _ in range(args.users)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as executor:
+        results = [t for times in executor.map(lambda name: type_name(args.url, name, args.max_chars, args.delay), names) for t in times]
+    elapsed = time.perf_counter() - start
+
+    print(f'{args.users} users, {args.threads} concurrent, {len(results)} requests in {elapsed:.1f}s ({len(results) / elapsed:.1f} requests/sec)')
+    print(f'{"all keystrokes":<24} {summary([t for _, t in results])}')
+    for n in range(1, args.max_chars + 1):
+        times = [t for length, t in results if length == n]
+        if times:
+            print(f'{f"{n} characters":<24} {summary(times)}')
+
+if __name__ == "__main__":
+    main()
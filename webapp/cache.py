@@ -0,0 +1,161 @@
+# result cache for /interaction-results, invalidated when an ingest bumps the data version
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from postgres.data_version import get_data_version
+from webapp.config import Config
+
+def cache_key(drugnames):
+    """The same set of drugs, in any order or case, maps to the same key."""
+    return '\n'.join(sorted({name.strip().lower() for name in drugnames if name.strip()}))
+
+class ResultCache:
+    """
+    LRU cache of JSON-serializable results, with a time-to-live and data-version stamps.
+
+    Entries live in memory (at most `maxsize`, least recently used evicted first) and, if
+    `path` is set, in an sqlite file under `path` (at most `disk_size`) that several webapp
+    worker processes can share. Each entry is stamped with the data version it was computed
+    from; once an ingest bumps the version (`postgres/data_version.py`), older entries are
+    dropped. The version is re-read from PostgreSQL at most every `version_check_interval`
+    seconds, and entries also expire `ttl` seconds after being computed.
+
+    `stats()` reports hits (from memory or disk), misses, hit rate, evictions and invalidations.
+    """
+    def __init__(self, maxsize=Config.RESULT_CACHE_SIZE, ttl=Config.RESULT_CACHE_TTL, path=Config.RESULT_CACHE_DIR,
+                 disk_size=Config.RESULT_CACHE_DISK_SIZE, version_check_interval=Config.DATA_VERSION_CHECK_INTERVAL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.disk_size = disk_size
+        self.version_check_interval = version_check_interval
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # key -> (version, expires at, value)
+        self.version = None
+        self.checked = 0.0
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+
+        self.db = None
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self.db = sqlite3.connect(os.path.join(path, 'results.db'), timeout=30, check_same_thread=False, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY, version TEXT, expires REAL NOT NULL, last_used REAL NOT NULL, value TEXT NOT NULL
+                )
+            """)
+            self.db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+
+    def current_version(self):
+        """The data version, re-read at most every `version_check_interval` seconds. Drops older entries when it changes."""
+        with self.lock:
+            if time.monotonic() - self.checked < self.version_check_interval:
+                return self.version
+        version = get_data_version()
+        with self.lock:
+            self.checked = time.monotonic()
+            if version != self.version:
+                if self.version is not None:
+                    self.counters['invalidations'] += 1
+                self.entries.clear()
+                if self.db is not None:
+                    self.db.execute("DELETE FROM results WHERE version IS NOT ?", (version,))
+                self.version = version
+            return version
+
+    def get(self, key):
+        """Returns the cached value for `key`, or None."""
+        version = self.current_version()
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] == version and entry[1] > now:
+                    self.entries.move_to_end(key)
+                    self.counters['memory_hits'] += 1
+                    return entry[2]
+                del self.entries[key]
+                self.counters['expired'] += 1
+
+            if self.db is not None:
+                row = self.db.execute("SELECT version, expires, value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[0] == version and row[1] > now:
+                    self.db.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+                    value = json.loads(row[2])
+                    self._remember(key, (version, row[1], value))
+                    self.counters['disk_hits'] += 1
+                    return value
+
+            self.counters['misses'] += 1
+            return None
+
+    def set(self, key, value):
+        """Caches `value` (JSON-serializable) under `key` for the current data version."""
+        version = self.current_version()
+        now = time.time()
+        expires = now + self.ttl
+        with self.lock:
+            self._remember(key, (version, expires, value))
+            if self.db is not None:
+                self.db.execute("BEGIN IMMEDIATE")
+                try:
+                    self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", (key, version, expires, now, json.dumps(value)))
+                    excess = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0] - self.disk_size
+                    if excess > 0:
+                        self.db.execute(
+                            "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used LIMIT ?)", (excess,)
+                        )
+                    self.db.execute("COMMIT")
+                except BaseException:
+                    self.db.execute("ROLLBACK")
+                    raise
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached value for `key`, computing (and caching) it with `compute()` on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        with self.lock:
+            hits = self.counters['memory_hits'] + self.counters['disk_hits']
+            lookups = hits + self.counters['misses']
+            return {
+                **self.counters,
+                'hits': hits,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'data_version': self.version,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM results")
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """The process-wide ResultCache, configured from `Config`."""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
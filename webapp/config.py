@@ -10,6 +10,19 @@ class Config:
     DB_HOST = os.environ.get("DB_HOST", "localhost")
     DB_PORT = os.environ.get("DB_PORT", 5432)
 
+    # /interaction-results search path: search/async_search.py, or the blocking search.execute_query
+    ASYNC_SEARCH = os.environ.get("ASYNC_SEARCH", "1") == "1"
+
+    # load the model and open the search clients at startup rather than on the first request (for production)
+    WARM_UP = os.environ.get("WARM_UP", "0") == "1"
+
+    # /interaction-results cache (webapp/cache.py)
+    RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 1024))                   # entries kept in memory per process
+    RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", 24 * 3600))                # seconds an entry stays valid
+    RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR")                                # shared on-disk cache for multiple workers (off if unset)
+    RESULT_CACHE_DISK_SIZE = int(os.environ.get("RESULT_CACHE_DISK_SIZE", 100000))       # entries kept on disk
+    DATA_VERSION_CHECK_INTERVAL = int(os.environ.get("DATA_VERSION_CHECK_INTERVAL", 10)) # seconds between data version checks
+
     @classmethod
     def get_db_uri(cls):
         return f"dbname={cls.DB_NAME} user={cls.DB_USER} password={cls.DB_PASSWORD} host={cls.DB_HOST} port={cls.DB_PORT}"
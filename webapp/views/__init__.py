@@ -3,4 +3,4 @@ from flask import Blueprint
 views_bp = Blueprint('views', __name__)
 
 # Import your routes here
-from . import index, medication, interaction_results
\ No newline at end of file
+from . import index, medication, interaction_results, health
\ No newline at end of file
@@ -0,0 +1,19 @@
+import psycopg2
+from flask import jsonify, current_app
+
+from . import views_bp
+from postgres.pool import connection, get_pool, PoolTimeout
+from webapp.cache import get_result_cache
+
+@views_bp.route('/health')
+def health():
+    # Liveness of the database behind the pool, plus pool and result cache counters
+    try:
+        with connection(timeout=5) as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        status, code = "ok", 200
+    except (psycopg2.Error, PoolTimeout) as e:
+        current_app.logger.error(f"Health check failed: {e}")
+        status, code = "unavailable", 503
+
+    return jsonify({"status": status, "pool": get_pool().stats(), "result_cache": get_result_cache().stats()}), code
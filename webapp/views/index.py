@@ -1,6 +1,6 @@
 from flask import request, jsonify, render_template, current_app
 from . import views_bp
-from postgres.helpers import get_db_conn
+from postgres.pool import connection
 import psycopg2
 
 @views_bp.route('/')
@@ -8,6 +8,43 @@ def index():
     # This route serves the main page (index.html) when users visit the home page
     return render_template('index.html')  # Render the index.html template
 
+def like_pattern(term):
+    """Escapes LIKE wildcards in user input."""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def find_medications(term, limit=10):
+    """
+    Medications whose name starts with `term` (case-insensitive), then, for terms of three or
+    more characters, ones containing it. Returns up to `limit` rows of
+    (med_name, drugid, generic_name, brand_name, source).
+
+    Prefix matches use the `lower(med_name) text_pattern_ops` index on the materialized
+    `openfda.medications` view, substring matches its trigram index.
+    """
+    term = like_pattern(term.strip().lower())
+    # the connection goes back to the pool even if a query fails
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT med_name, drugid, generic_name, brand_name, source
+            FROM openfda.medications
+            WHERE lower(med_name) LIKE %s
+            ORDER BY lower(med_name), med_name, drugid
+            LIMIT %s
+        """, (term + '%', limit))
+        rows = cursor.fetchall()
+
+        if len(rows) < limit and len(term) >= 3:
+            cursor.execute("""
+                SELECT med_name, drugid, generic_name, brand_name, source
+                FROM openfda.medications
+                WHERE lower(med_name) LIKE %s AND lower(med_name) NOT LIKE %s
+                ORDER BY lower(med_name), med_name, drugid
+                LIMIT %s
+            """, ('%' + term + '%', term + '%', limit - len(rows)))
+            rows += cursor.fetchall()
+
+    return rows
+
 @views_bp.route('/autocomplete')
 def autocomplete():
     term = request.args.get('q', '')
@@ -16,28 +53,16 @@ def autocomplete():
         return jsonify({"error": "Query parameter 'q' is required."}), 400
 
     try:
-        conn = get_db_conn()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT DISTINCT med_name, drugid, generic_name, brand_name, source
-            FROM openfda.medications
-            WHERE med_name ILIKE %s
-            ORDER BY med_name
-            LIMIT 10
-        """, (term + '%',))
-        
         results = [
             {
-                'med_name': row[0],
-                'drugid': row[1],
-                'generic_names': [v.strip() for v in row[2]],
-                'brand_names': [v.strip() for v in row[3]],
-                'source': row[4]
+                'med_name': med_name,
+                'drugid': drugid,
+                'generic_names': [v.strip() for v in generic_names or []],
+                'brand_names': [v.strip() for v in brand_names or []],
+                'source': source
             }
-            for row in cursor.fetchall()
+            for med_name, drugid, generic_names, brand_names, source in find_medications(term)
         ]
-        cursor.close()
-        conn.close()
 
         if not results:
             return jsonify({"message": "No medications found for your query."}), 404
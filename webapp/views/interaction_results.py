@@ -1,23 +1,47 @@
 from flask import request, render_template
 
 from . import views_bp
-from search.search_functions import get_med_info, execute_query
+from search.async_search import get_async_search
+from search.search import execute_query
+from search.search_functions import get_med_info
+from webapp.cache import cache_key, get_result_cache
+from webapp.config import Config
+
+def compute_results(drugnames):
+    """Label warnings and adverse event summary for a set of drugs, as a JSON-serializable dict."""
+    if Config.ASYNC_SEARCH:
+        # label lookups, search and enrichment overlap on the shared event loop
+        async_search = get_async_search()
+        druginfo, (query_results, reaction_summary, strong_results, serious_results) = async_search.run(async_search.interaction_results(drugnames))
+    else:
+        # ITEM ONE: druginfo
+        druginfo = {}
+
+        for drugname in drugnames:
+            label_warning = get_med_info(drugname)
+            druginfo[drugname] = label_warning
+
+        # ITEM TWO: events results
+        query_results, reaction_summary, strong_results, serious_results = execute_query(drugnames)
+    num_reports = len(query_results)
+    strength = strong_results/num_reports * 100 if num_reports else 0
+    seriousness = serious_results/num_reports * 100 if num_reports else 0
+
+    return {'druginfo': druginfo, 'reaction_summary': reaction_summary, 'num_reports': num_reports, 'risk': strength, 'seriousness': seriousness}
 
 @views_bp.route('/interaction-results')
 def serve_results():
     drugnames = request.args.getlist('drugnames')
 
-    # ITEM ONE: druginfo
-    druginfo = {}
+    # the results only change when an ingest runs, so the same drug set (in any order or case) is served from the cache
+    key = cache_key(drugnames)
+    context = get_result_cache().get_or_compute(key, lambda: compute_results(key.split('\n') if key else []))
 
+    # the cached label warnings are keyed by normalized name; show them under the names as submitted, in order
+    shown = {}
     for drugname in drugnames:
-        label_warning = get_med_info(drugname)
-        druginfo[drugname] = label_warning
-
-    # ITEM TWO: events results
-    query_results, reaction_summary, strong_results, serious_results = execute_query(drugnames)
-    strength = strong_results/len(query_results) * 100
-    seriousness = serious_results/len(query_results) * 100
+        if drugname.strip():
+            shown.setdefault(drugname.strip().lower(), drugname.strip())
+    druginfo = {display: context['druginfo'][name] for name, display in shown.items() if name in context['druginfo']}
 
-    context = {'druginfo': druginfo, 'reaction_summary': reaction_summary, 'num_reports': len(query_results), 'risk': strength, 'seriousness': seriousness}
-    render_template('interaction-results.html', **context)
+    return render_template('interaction_results.html', **{**context, 'druginfo': druginfo})
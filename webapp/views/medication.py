@@ -1,26 +1,23 @@
-from os import abort
 import re
 
-from flask import render_template, redirect
+from flask import abort, render_template, redirect
 from psycopg2.extras import RealDictCursor
 
 from . import views_bp
-from postgres.helpers import get_db_conn
+from postgres.pool import connection
 
 openfda_cols = ["set_id", "effective_time", "application_number", "manufacturer_name", "product_ndc", "product_type", "administration_route", "rxcui", "spl_id", "spl_id_primary", "spl_set_id", "package_ndc", "nui", "pharm_class_epc", "pharm_class_moa", "unii"]
 
 @views_bp.route("/medication/<drugid>", methods=["GET"])
 def med_info(drugid):
-    conn = get_db_conn()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-    cursor.execute("""
-        SELECT * 
-        FROM openfda.drugs
-        WHERE drugid = %s;
-    """, (drugid,))
-
-    info_raw = cursor.fetchone()
+    with connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute("""
+            SELECT * 
+            FROM openfda.drugs
+            WHERE drugid = %s;
+        """, (drugid,))
+
+        info_raw = cursor.fetchone()
     if info_raw is None:
         abort(404)
 
@@ -47,6 +44,8 @@ def med_info(drugid):
                     substance_name = content
             case "spl_id_primary":
                 pass  # should never be included
+            case "ingested_at":
+                pass  # load bookkeeping (search/name_resolver.py)
             case col if col in openfda_cols:
                 pretty_title = re.sub(r'_', ' ', col).title()
                 openfda_fields[pretty_title] = content
@@ -55,16 +54,13 @@ def med_info(drugid):
                     pretty_title = re.sub(r'_', ' ', colname).title()
                     other_fields[pretty_title] = content
 
-    cursor.close()
-    conn.close()
-
     if len(brand_name) == 0:
         brand_name = None
     if len(substance_name) == 0:
         substance_name = None
-    if openfda_fields.empty():
+    if not openfda_fields:
         openfda_fields = None
-    if other_fields.empty():
+    if not other_fields:
         other_fields = None
 
     context = {"drug_name": drugname, "generic_name": generic_name, "brand_name": brand_name, "substance_name": substance_name, "openfda": openfda_fields, "fields": other_fields}
@@ -72,14 +68,11 @@ def med_info(drugid):
 
 @views_bp.route("/medication-search/<drugname>", methods=["GET"])
 def med_search(drugname):
-    conn = get_db_conn()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT drugid FROM openfda.medications WHERE med_name = %s", (drugname,))
-
-    result = cursor.fetchone()[0]
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT drugid FROM openfda.medications WHERE med_name = %s", (drugname,))
+        result = cursor.fetchone()
 
     if not result:
         abort(404)
 
-    return redirect(f"/medication/{result}")
\ No newline at end of file
+    return redirect(f"/medication/{result[0]}")